@@ -16,15 +16,17 @@ import bikeshare_constants as b_c
 import bikeshare_inputs as b_i
 import bikeshare_data as b_d
 import bikeshare_stats as b_s
+import bikeshare_memo as b_m
 
 # Run the method which gets the user's inputs
 #
-city, month, day, proceed = b_i.get_inputs(df=None, city=None, month=None, day=None, proceed=True)
+city, month, day, year, proceed = b_i.get_inputs(df=None, city=None, month=None, day=None, proceed=True)
 print()
 
-# Load the data
+# Load the data, and start computing the analyses in the background
 #
-df = b_d.load_data( city, month, day )
+df = b_d.load_data( city, month, day, year=year )
+b_m.precompute(df, city, month, day, year)
 
 # Proceed with the analysis
 #
@@ -32,32 +34,53 @@ while True:
     msg = "Do another analysis? "
     # Get the action (i.e Analyze the time data )
     set_action = b_i.get_action()
-    if set_action == "View raw data":
+    if df.empty and set_action not in [ "View raw data", "Supply new inputs", "Exit" ]:
+        #
+        # There is nothing to analyze, e.g. a day of the week missing from a short month
+        #
+        print('\nNo trips pass the filters. Please supply new inputs.\n')
+    elif set_action == "View raw data":
         print()
-        b_d.show_data(df, city, month, day, row=0, increment = 5 )
+        b_d.show_data(df, city, month, day, row=0, increment = 5, year=year )
     elif set_action == "Analyze the time data":
         print()
-        b_s.time_stats(df, city, month, day)
+        b_s.show_time_stats(b_m.result(df, city, month, day, year, 'time'), city, month, day, year)
     elif set_action == "Analyze the station data":
         print()
-        b_s.station_stats(df, city, month, day )
+        b_s.show_station_stats(b_m.result(df, city, month, day, year, 'station'), city, month, day, year)
     elif set_action == "Analyze the trip duration data":
         print()
-        b_s.trip_duration_stats(df, city, month, day )
+        b_s.show_trip_duration_stats(b_m.result(df, city, month, day, year, 'trip duration'), city, month, day, year)
     elif set_action == "Analyze the users data":
         print()
-        b_s.user_stats(df, city, month, day )
+        b_s.show_user_stats(b_m.result(df, city, month, day, year, 'user'), city, month, day, year)
+    elif set_action == "Analyze the bikes in use":
+        print()
+        b_s.show_concurrency_stats(b_m.result(df, city, month, day, year, 'bikes in use'), city, month, day, year)
+    elif set_action == "Analyze the station flow":
+        print()
+        b_s.show_flow_stats(b_m.result(df, city, month, day, year, 'station flow'), city, month, day, year)
+    elif set_action == "Analyze the routes":
+        print()
+        b_s.show_route_stats(b_m.result(df, city, month, day, year, 'routes'), city, month, day, year)
+    elif set_action == "Analyze the demand by hour":
+        print()
+        b_s.show_heatmap_stats(b_m.result(df, city, month, day, year, 'demand by hour'), city, month, day, year)
     elif set_action == "Supply new inputs":
         print()
-        city, month, day, proceed = b_i.get_inputs( None, None, None, None, False )
-        df = b_d.load_data( city, month, day )
+        b_m.cancel_precompute()
+        city, month, day, year, proceed = b_i.get_inputs( None, None, None, None, False )
+        df = b_d.load_data( city, month, day, year=year )
+        b_m.precompute(df, city, month, day, year)
     else:
         # Stop
         #
         print()
         proceed = b_i.get_yes_or_no( "Are you sure? " )
         if proceed:
+            b_m.cancel_precompute()
             break
    
+print('\n', b_m.cache_stats())
 print('\n', 'See ya!')
 sys.exit()
@@ -0,0 +1,388 @@
+import sys
+
+from collections import namedtuple
+from functools import reduce
+
+# The following tests if the pandas and numpy libraries have been loaded
+#
+try:
+    import pandas as pd
+except ImportError as error:
+    print('\n', '\tpandas has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+import bikeshare_constants as b_c
+import bikeshare_stations as b_st
+import bikeshare_sketches as b_sk
+
+# The mode of a field, how often it occurs, how many different values there
+# are, and the (name, count) of the leading values, the mode first
+#
+FieldStats = namedtuple('FieldStats', ['mode', 'count', 'range', 'top'])
+
+# The count of every value of a categorical field in every group which has
+# any rows, and the percentage of the group's trips each count makes up,
+# rounded to one place as pandas value_counts(normalize=True) would be
+#
+#   labels      - the label of each group, in display order
+#   names       - the value of each column, in category order
+#   counts      - the counts, one row per group
+#   percentages - the percentages, one row per group
+#
+Breakdown = namedtuple('Breakdown', ['labels', 'names', 'counts', 'percentages'])
+
+
+def group_codes(df, group_field):
+    """
+    Codes the groups of a grouping column as 0, 1, 2, ...
+    Args:
+        (dataframe) df - the data set
+        (str) group_field - the column to group by, or None for a single group
+    Returns:
+        (array) the group code of each row
+        (list) the label of each group code, in display order
+    """
+    if group_field is None:
+        return np.zeros(len(df.index), dtype=np.int8), [ 'All' ]
+
+    values = df[group_field]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), list(values.cat.categories)
+
+    labels, codes = np.unique(values.to_numpy(), return_inverse=True)
+
+    return codes, list(labels)
+
+def chunk_labels(df, group_field, chunksize=b_c.CHUNK_SIZE):
+    """
+    Finds the labels of the groups of a grouping column, in the same order
+    as group_codes, reading the column a chunk of rows at a time.
+    Args:
+        (dataframe) df - the data set
+        (str) group_field - the column to group by, or None for a single group
+        (int) chunksize - how many rows to read at a time
+    Returns:
+        (list) the label of each group code, in display order
+    """
+    if group_field is None:
+        return [ 'All' ]
+
+    values = df[group_field]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return list(values.cat.categories)
+
+    values = values.to_numpy()
+    return list(reduce(np.union1d, ( np.unique(values[start:start + chunksize])
+                                     for start in range(0, len(values), chunksize) ), values[:0]))
+
+def row_chunks(df, group_field, labels, field_name, chunksize=b_c.CHUNK_SIZE):
+    """
+    Yields the group codes and the codes of a station field a chunk of rows
+    at a time. Nothing the length of the data is made, so when the data is
+    mapped from the cache only the pages of one chunk are read at once.
+    Args:
+        (dataframe) df - the data set
+        (str) group_field - the column to group by, or None for a single group
+        (list) labels - the label of each group code, from chunk_labels
+        (str) field_name - 'Start Station', 'End Station' or 'Trips'
+        (int) chunksize - how many rows to read at a time
+    Returns:
+        the (group codes, field codes) of each chunk
+    """
+    for start in range(0, len(df.index), chunksize):
+        rows = df.iloc[start:start + chunksize]
+        if group_field is None:
+            groups = np.zeros(len(rows.index), dtype=np.int8)
+        elif isinstance(rows[group_field].dtype, pd.CategoricalDtype):
+            groups = rows[group_field].cat.codes.to_numpy()
+        else:
+            groups = np.searchsorted(np.asarray(labels), rows[group_field].to_numpy())
+        yield groups, b_st.field_codes(rows, field_name)[0]
+
+def grouped_counts(groups, codes, n_groups, size, weights=None):
+    """
+    Counts every (group, code) pair which occurs, in one pass.
+
+    A dense 2-D bincount is used while the table is small enough, and a
+    sort of the combined keys otherwise, so memory stays bounded for
+    domains as large as the trip codes.
+    Args:
+        (array) groups - the group code of each row
+        (array) codes - the value code of each row, -1 where missing
+        (int) n_groups - how many groups there are
+        (int) size - how many different value codes there can be
+        (array) weights - how many trips each row stands for, if not one
+    Returns:
+        (array) the group of each pair, sorted
+        (array) the value code of each pair
+        (array) the count of each pair
+    """
+    valid = codes >= 0
+    keys = groups[valid].astype(np.int64) * size + codes[valid]
+    if weights is not None:
+        weights = weights[valid]
+
+    if n_groups * size <= b_c.DENSE_COUNT_LIMIT:
+        counts = np.bincount(keys, weights=weights, minlength=n_groups * size)
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    elif weights is None:
+        keys, counts = np.unique(keys, return_counts=True)
+    else:
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights)
+
+    return keys // size, keys % size, counts.astype(np.int64)
+
+def segment_starts(pair_groups):
+    """
+    Returns where each group starts in pairs which are sorted by group.
+    Args:
+        (array) pair_groups - the group of each pair, sorted
+    """
+    return np.flatnonzero(np.r_[True, pair_groups[1:] != pair_groups[:-1]])
+
+def top_positions(counts, n, key=None):
+    """
+    Selects the n largest counts with a partial sort, argpartition finding
+    the n-th largest count without sorting the rest. Ties go to the
+    smallest key, or to the first position, so that the leaders are the
+    same on every run. Counts of 0 are never selected.
+    Args:
+        (array) counts - the counts
+        (int) n - how many counts to select
+        (function) key - maps a position to what ties are broken by
+    Returns:
+        (array) the positions of the selected counts, largest first
+    """
+    counts = np.asarray(counts)
+    if len(counts) > n:
+        # Keep every count tied with the n-th largest, then order those few
+        #
+        kth = counts[np.argpartition(-counts, n - 1)[n - 1]]
+        candidates = np.flatnonzero(counts >= max(kth, 1))
+    else:
+        candidates = np.flatnonzero(counts > 0)
+
+    if key is None:
+        order = np.lexsort((candidates, -counts[candidates]))
+        return candidates[order][:n]
+
+    return np.array(sorted(candidates, key=lambda ix: (-counts[ix], key(ix)))[:n], dtype=np.int64)
+
+def mode_stats_by(groups, labels, codes, size, name_of, weights=None, top_n=1):
+    """
+    Finds the mode, top count, number of different values and leading
+    values of one coded field for every group.
+    Args:
+        (array) groups - the group code of each row
+        (list) labels - the label of each group code
+        (array) codes - the value code of each row, -1 where missing
+        (int) size - how many different value codes there can be
+        (function) name_of - decodes a value code for display
+        (array) weights - how many trips each row stands for, if not one
+        (int) top_n - how many leading values to find
+    Returns:
+        (dict) the FieldStats of each group label which occurs
+    """
+    pair_groups, pair_codes, pair_counts = grouped_counts(groups, codes, len(labels), size, weights)
+    if not len(pair_counts):
+        return {}
+
+    starts = segment_starts(pair_groups)
+    ranges = np.diff(np.r_[starts, len(pair_counts)])
+
+    results = {}
+    for start, range_f_n in zip(starts, ranges):
+        segment_codes = pair_codes[start:start + range_f_n]
+        segment_counts = pair_counts[start:start + range_f_n]
+        #
+        # Break ties the way pandas does, by taking the smallest name
+        #
+        top = tuple( (name_of(segment_codes[ix]), int(segment_counts[ix]))
+                     for ix in top_positions(segment_counts, top_n, lambda ix: name_of(segment_codes[ix])) )
+        results[labels[pair_groups[start]]] = FieldStats(top[0][0], top[0][1], int(range_f_n), top)
+
+    return results
+
+def approximate_stats_by(chunks, labels, size, name_of, k=b_c.TOPK_SIZE,
+                         precision=b_c.APPROXIMATE_PRECISION, top_n=1):
+    """
+    Finds the approximate mode and top count, and the estimated number of
+    different values, of one coded field for every group.
+
+    The rows are read one chunk at a time, e.g. from row_chunks, and the
+    counts of each chunk are summarised as a Space-Saving summary of k
+    codes per group and merged into the summary of the rows before it,
+    while the different codes are added to a HyperLogLog sketch per group.
+    So besides one chunk only k codes and 2 ** precision registers are
+    held per group, however many rows and different values there are. A
+    top count is too high by at most the number of rows in the group / k.
+    Args:
+        (iterable) chunks - the (group codes, value codes) of each chunk of
+                            rows, the value codes -1 where missing
+        (list) labels - the label of each group code
+        (int) size - how many different value codes there can be
+        (function) name_of - decodes a value code for display
+        (int) k - how many codes each summary holds
+        (int) precision - the HyperLogLog precision of the range sketches
+        (int) top_n - how many leading values to find
+    Returns:
+        (dict) the FieldStats of each group label which occurs
+    """
+    summaries = [ b_sk.empty_topk() for label in labels ]
+    distinct = [ b_sk.distinct_of(np.zeros(0, dtype=np.int64), precision) for label in labels ]
+
+    for groups, codes in chunks:
+        pair_groups, pair_codes, pair_counts = grouped_counts(groups, codes, len(labels), size)
+        starts = segment_starts(pair_groups)
+        for segment_start, segment_end in zip(starts, np.r_[starts[1:], len(pair_groups)].astype(int)):
+            group = pair_groups[segment_start]
+            segment = slice(segment_start, segment_end)
+            summary = b_sk.topk_of_counts(pair_codes[segment], pair_counts[segment], k)
+            summaries[group] = b_sk.merge_topk(summaries[group], summary, k)
+            distinct[group] = b_sk.merge_distinct(distinct[group], b_sk.distinct_of(pair_codes[segment], precision))
+
+    results = {}
+    for label, summary, seen in zip(labels, summaries, distinct):
+        if summary.total:
+            code, count, error = b_sk.topk_mode(summary, name_of)
+            top = tuple( (name_of(summary.codes[ix]), int(summary.counts[ix]))
+                         for ix in top_positions(summary.counts, top_n, lambda ix: name_of(summary.codes[ix])) )
+            results[label] = FieldStats(name_of(code), count, b_sk.distinct_count(seen), top)
+
+    return results
+
+def distinct_sketches_by(groups, labels, codes, group_field, field_name, precision, sketches):
+    """
+    Sketches the different values of a field for every group.
+
+    Sketches already made for the field by another grouping are merged
+    into the sketch of the single group instead of reading the rows again,
+    so the ranges of every month roll up to the range of all of them.
+    Args:
+        (array) groups - the group code of each row
+        (list) labels - the label of each group code
+        (array) codes - the value code of each row, -1 where missing
+        (str) group_field - the column grouped by, or None for a single group
+        (str) field_name - the field
+        (int) precision - the HyperLogLog precision, or None to count exactly
+        (dict) sketches - the sketches made so far, by field and grouping
+    Returns:
+        (dict) the Distinct sketch of each group label
+    """
+    key = (field_name, group_field)
+    if key not in sketches:
+        made = [ by for name, by in sketches if name == field_name and by is not None ]
+        if group_field is None and made:
+            sketches[key] = { 'All': reduce(b_sk.merge_distinct, sketches[(field_name, made[0])].values()) }
+        else:
+            sketches[key] = dict(zip(labels, b_sk.distinct_by(groups, len(labels), codes, precision)))
+
+    return sketches[key]
+
+def field_stats_by(df, group_field, fields, approximate=False, precision=None, sketches=None, top_n=1):
+    """
+    Finds the mode, top count and number of different values of several
+    station fields for every group, counting each field once.
+    Args:
+        (dataframe) df - the data set
+        (str) group_field - the column to group by, or None for a single group
+        (list) fields - the station fields, e.g. STATION_FIELDS
+        (boolean) approximate - find the modes with Space-Saving summaries and the
+                                ranges with HyperLogLog sketches, reading the rows
+                                a chunk at a time
+        (int) precision - estimate the ranges with HyperLogLog sketches of this
+                          precision, or None to count them exactly, or when
+                          approximate to use APPROXIMATE_PRECISION
+        (dict) sketches - the range sketches of earlier calls on the same data,
+                          which are reused and added to
+        (int) top_n - how many leading values of each field to find
+    Returns:
+        (dict) the FieldStats of each field, by field name, for each group
+               label which occurs, in display order
+    """
+    if approximate:
+        labels = chunk_labels(df, group_field)
+    else:
+        groups, labels = group_codes(df, group_field)
+    results = { label: {} for label in labels }
+
+    for field_name in fields:
+        codes, size = b_st.field_codes(df, field_name)
+        name_of = lambda code: b_st.field_name_of(df, field_name, code)
+
+        # Estimated modes come with estimated ranges, from the chunks of rows
+        #
+        if approximate:
+            field_stats = approximate_stats_by(row_chunks(df, group_field, labels, field_name), labels, size, name_of,
+                                               precision=precision or b_c.APPROXIMATE_PRECISION, top_n=top_n)
+        else:
+            field_stats = mode_stats_by(groups, labels, codes, size, name_of, top_n=top_n)
+
+        # The exact ranges come with the counts; estimated ones from the sketches
+        #
+        if precision is not None and not approximate:
+            ranges = distinct_sketches_by(groups, labels, codes, group_field, field_name, precision,
+                                          {} if sketches is None else sketches)
+            field_stats = { label: field._replace(range=b_sk.distinct_count(ranges[label]))
+                            for label, field in field_stats.items() }
+
+        for label, field in field_stats.items():
+            results[label][field_name] = field
+
+    return { label: field_stats for label, field_stats in results.items() if field_stats }
+
+def breakdown_by(df, group_field, field_name):
+    """
+    Counts every value of a categorical field, such as User Type or Gender,
+    for every group in a single 2-D bincount pass, and finds the share of
+    the group's trips each value makes up.
+    Args:
+        (dataframe) df - the data set
+        (str) group_field - the column to group by, or None for a single group
+        (str) field_name - the categorical field
+    Returns:
+        (Breakdown) the counts and percentages
+    """
+    groups, labels = group_codes(df, group_field)
+    codes, names = pd.factorize(df[field_name], sort=True)
+    n_groups, size = len(labels), max(len(names), 1)
+
+    valid = codes >= 0
+    keys = groups[valid].astype(np.int64) * size + codes[valid]
+    counts = np.bincount(keys, minlength=n_groups * size).reshape(n_groups, size)[:, :len(names)]
+
+    # Missing values count towards neither the counts nor the totals
+    #
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percentages = np.round(counts / counts.sum(axis=1, keepdims=True) * 100, 1)
+
+    occurs = np.bincount(groups.astype(np.int64), minlength=n_groups) > 0
+
+    return Breakdown([ label for label, occurs_g in zip(labels, occurs) if occurs_g ], list(names),
+                     counts[occurs], percentages[occurs])
+
+def main():
+
+    import bikeshare_data as b_d
+
+    print("Testing: field_stats_by")
+    df = b_d.read_data('chicago')
+    for group_field in [ None, 'Month', 'Day of Week' ]:
+        for label, stats in field_stats_by(df, group_field, b_c.STATION_FIELDS).items():
+            print(label, stats)
+
+    print("Testing: breakdown_by")
+    for group_field in [ None, 'Month', 'Day of Week' ]:
+        breakdown = breakdown_by(df, group_field, 'Gender')
+        print(breakdown.names, breakdown.labels)
+        print(breakdown.counts, breakdown.percentages, sep='\n')
+
+if __name__ == "__main__":
+    main()
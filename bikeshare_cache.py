@@ -0,0 +1,529 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+
+# The following tests if the pandas and numpy libraries have been loaded
+#
+try:
+    import pandas as pd
+except ImportError as error:
+    print('\n', '\tpandas has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+import bikeshare_constants as b_c
+import bikeshare_stations as b_st
+
+
+def fingerprint(file_name, rows):
+    """
+    Identifies the current contents of a source file of the cache.
+    Args:
+        (str) file_name - the csv file
+        (int) rows - how many rows of the file are in the cache
+    Returns:
+        (dict) the path, size, mtime, content hash and rows of the file
+    """
+    file_stat = os.stat(file_name)
+
+    return { 'path': os.path.abspath(file_name),
+             'size': file_stat.st_size,
+             'mtime': file_stat.st_mtime_ns,
+             'hash': content_hash(file_name),
+             'rows': rows }
+
+def content_hash(file_name, size=None):
+    """
+    Hashes the contents of a file one block at a time.
+    Args:
+        (str) file_name - the file to hash
+        (int) size - only hash this many bytes from the start of the file
+    Returns:
+        (str) the hex digest of the file
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    remaining = size
+
+    with open(file_name, 'rb') as source:
+        for block in iter(lambda: source.read(b_c.CACHE_BLOCK_SIZE), b''):
+            if remaining is not None:
+                block = block[:remaining]
+                remaining -= len(block)
+            digest.update(block)
+            if remaining == 0:
+                break
+
+    return digest.hexdigest()
+
+def cache_path(city):
+    """
+    Returns the directory in which the parsed data of a city is cached.
+    Args:
+        (str) city - name of the city
+    """
+    return os.path.join(b_c.CACHE_DIR, city.replace(' ', '_'))
+
+def read_manifest(city):
+    """
+    Reads the manifest of a city's cache.
+    Args:
+        (str) city - name of the city
+    Returns:
+        (dict) the manifest, or None if there is no usable cache
+    """
+    try:
+        with open(os.path.join(cache_path(city), 'manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('version') != b_c.CACHE_VERSION:
+        return None
+
+    return manifest
+
+def source_status(source):
+    """
+    Compares a source file of the cache with its current contents.
+    Args:
+        (dict) source - the fingerprint of the file when it was cached
+    Returns:
+        (str) 'fresh' if unchanged, 'extended' if rows were only added to
+              its end, otherwise 'stale'
+    """
+    try:
+        file_stat = os.stat(source['path'])
+    except OSError:
+        return 'stale'
+
+    # Only hash the file when the cheap checks pass
+    #
+    if file_stat.st_size == source['size']:
+        if file_stat.st_mtime_ns == source['mtime'] or content_hash(source['path']) == source['hash']:
+            return 'fresh'
+        return 'stale'
+
+    if file_stat.st_size > source['size'] and content_hash(source['path'], source['size']) == source['hash']:
+        return 'extended'
+
+    return 'stale'
+
+def data_stamp(manifest):
+    """
+    Identifies the data of a city's cache by its rows and the hashes of its
+    sources, so that anything derived from it can tell when it is out of date.
+    Args:
+        (dict) manifest - the manifest of the cache
+    Returns:
+        (str) the stamp
+    """
+    return json.dumps([ manifest['rows'] ] + [ source['hash'] for source in manifest['sources'] ])
+
+def cached_years(city):
+    """
+    Returns the years held in the cache of a city.
+    Args:
+        (str) city - name of the city
+    Returns:
+        (list) the years, oldest first
+    """
+    manifest = read_manifest(city)
+    if manifest is None:
+        return []
+
+    return sorted( set( partition['key']['Year'] for partition in manifest['partitions']
+                        if 'Year' in partition['key'] ) )
+
+def cached_months(city, year='all'):
+    """
+    Returns the months held in the cache of a city.
+    Args:
+        (str) city - name of the city
+        (str) year - the year to look in, or "all" to look in every year
+    Returns:
+        (list) the number of each month, January first, or None if the cache
+               is not partitioned by month
+    """
+    manifest = read_manifest(city)
+    if manifest is None:
+        return []
+    if 'Month' not in b_c.PARTITION_BY:
+        return None
+
+    return sorted( set( partition['key']['Month'] for partition in manifest['partitions']
+                        if year == 'all' or partition['key'].get('Year', int(year)) == int(year) ) )
+
+def read_cache(city, where=None):
+    """
+    Loads the parsed data of a city from its cache.
+
+    The rows of the cache are ordered by the columns in PARTITION_BY, so
+    the rows of each partition are contiguous in the column files and only
+    the partitions which can hold rows passing the filters are read. Each
+    column is memory-mapped rather than read, and the partitions selected
+    are sliced out of the mapped files, so the whole city, a single
+    partition or a run of adjacent ones, e.g. every month of one year, is
+    used without copying it, and runs on the same host share the pages in
+    the page cache. Only partitions which are not adjacent, e.g. the same
+    month of several years, are copied into one frame. The caller checks
+    that the cache is up to date with source_status.
+    Args:
+        (str) city - name of the city
+        (dict) where - the value each partition column must have, if filtered
+    Returns:
+        df - Pandas DataFrame holding the parsed and derived columns, with
+             the stamp of the data in df.attrs['stamp'], or None if there is no cache
+        (list) the column headings of the source file
+    """
+    manifest = read_manifest(city)
+    if manifest is None:
+        return None, None
+
+    where = where or {}
+    partitions = [ partition for partition in manifest['partitions']
+                   if all( partition['key'].get(field_name, value) == value
+                           for field_name, value in where.items() ) ]
+
+    # Join adjacent partitions into one run of rows
+    #
+    runs = []
+    for partition in partitions:
+        if runs and runs[-1][1] == partition['start']:
+            runs[-1][1] += partition['rows']
+        else:
+            runs.append([ partition['start'], partition['start'] + partition['rows'] ])
+
+    path = os.path.join(cache_path(city), manifest['dir'])
+    try:
+        frames = [ read_rows(path, slice(*run), manifest) for run in runs ]
+        if not frames:
+            # No partition passes the filters, so return the columns without any rows
+            #
+            frames = [ read_rows(path, slice(0, 0), manifest) ]
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+    df = frames[0] if len(frames) == 1 else pd.concat(frames)
+    if df.index.equals(pd.RangeIndex(len(df.index))):
+        df.index = pd.RangeIndex(len(df.index))
+
+    # Keep the stamp of the data read with the frame, as the cache can be
+    # updated by another run while the frame is in use
+    #
+    df.attrs['stamp'] = data_stamp(manifest)
+
+    return df, manifest['headings']
+
+def read_rows(path, rows, manifest):
+    """
+    Memory-maps a run of rows of a city's cache.
+    Args:
+        (str) path - the directory of the column files
+        (slice) rows - the positions of the rows in the files
+        (dict) manifest - the manifest of the cache
+    Returns:
+        df - Pandas DataFrame over the files
+    """
+    columns = {}
+    for column in manifest['columns']:
+        columns[column['name']] = read_column(path, column, manifest['dictionaries'], rows)
+    index = np.load(os.path.join(path, 'index.npy'), mmap_mode='r', allow_pickle=False)[rows]
+
+    return pd.DataFrame(columns, columns=[column['name'] for column in manifest['columns']],
+                        index=index, copy=False)
+
+def read_column(path, column, dictionaries, rows=slice(None)):
+    """
+    Memory-maps one column of a city's cache.
+    Args:
+        (str) path - the directory of the column files
+        (dict) column - the manifest entry of the column
+        (dict) dictionaries - the labels of the coded columns, by name
+        (slice) rows - the positions of the rows to map
+    Returns:
+        the values of the column
+    """
+    values = np.load(os.path.join(path, column['file']), mmap_mode='r', allow_pickle=False)[rows]
+
+    # Strings are stored as codes into a dictionary held in the manifest
+    #
+    if column['kind'] == 'category':
+        dtype = pd.CategoricalDtype(dictionaries[column['dictionary']])
+        return pd.Categorical.from_codes(values, dtype=dtype)
+
+    # Nullable integers are stored as their values plus a mask of the missing ones
+    #
+    if column['kind'] in b_c.NULLABLE_DTYPES:
+        mask = np.load(os.path.join(path, column['mask']), mmap_mode='r', allow_pickle=False)[rows]
+        return pd.arrays.IntegerArray(values, mask)
+
+    return values
+
+def add_dictionary(dictionaries, name, labels):
+    """
+    Adds the labels of a coded column to the dictionaries of the manifest,
+    sharing them with any column which has the same labels.
+    Args:
+        (dict) dictionaries - the labels of the coded columns, by name
+        (str) name - the name of the column
+        (list) labels - the labels of the column
+    Returns:
+        (str) the name of the dictionary holding the labels
+    """
+    for dictionary, known_labels in dictionaries.items():
+        if known_labels == labels:
+            return dictionary
+
+    dictionaries[name] = labels
+
+    return name
+
+def write_column(path, file_stem, name, values, dictionaries):
+    """
+    Saves one column of a city's cache.
+    Args:
+        (str) path - the directory of the cache
+        (str) file_stem - the file name to use for the column
+        (str) name - the name of the column
+        (series) values - the values of the column
+        (dict) dictionaries - the labels of the coded columns, by name
+    Returns:
+        (dict) the manifest entry of the column
+    """
+    column = { 'name': name, 'file': file_stem + '.npy', 'kind': str(values.dtype) }
+
+    # Store strings as codes so that the files can be mapped without pickle
+    #
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        column['dictionary'] = add_dictionary(dictionaries, name, values.cat.categories.tolist())
+        data = values.cat.codes.to_numpy()
+    elif column['kind'] in b_c.NULLABLE_DTYPES:
+        column['mask'] = file_stem + '.mask.npy'
+        np.save(os.path.join(path, column['mask']), values.isna().to_numpy(), allow_pickle=False)
+        data = values.array.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0)
+    else:
+        data = values.to_numpy()
+
+    np.save(os.path.join(path, column['file']), data, allow_pickle=False)
+
+    return column
+
+def to_json(value):
+    """
+    Converts a numpy scalar to the python value stored in the manifest.
+    """
+    return value.item() if hasattr(value, 'item') else value
+
+def write_columns(path, df, dictionaries):
+    """
+    Saves rows of a city as one .npy file per column.
+    Args:
+        (str) path - the directory of the column files
+        (dataframe) df - the rows
+        (dict) dictionaries - the labels of the coded columns, by name
+    Returns:
+        (list) the manifest entries of the columns
+    """
+    columns = []
+    for ix, name in enumerate(df.columns):
+        columns.append(write_column(path, f'{ix:02d}', name, df[name], dictionaries))
+    np.save(os.path.join(path, 'index.npy'), df.index.to_numpy(), allow_pickle=False)
+
+    return columns
+
+def write_rows(path, df, manifest, rows_dir):
+    """
+    Saves the rows of a city ordered by the columns in PARTITION_BY, so that
+    the rows of each partition are contiguous, and records in the manifest
+    where each partition starts.
+    Args:
+        (str) path - the directory of the cache
+        (dataframe) df - the parsed and derived city data
+        (dict) manifest - the manifest of the cache
+        (str) rows_dir - the directory to save the column files in
+    """
+    partitions = []
+    order = []
+    start = 0
+    for key, rows in partition_rows(df):
+        partitions.append({ 'key': key, 'start': start, 'rows': len(rows) })
+        order.append(rows)
+        start += len(rows)
+
+    os.makedirs(os.path.join(path, rows_dir))
+    rows = df.take(np.concatenate(order)) if order else df
+    manifest['columns'] = write_columns(os.path.join(path, rows_dir), rows, manifest['dictionaries'])
+    manifest['partitions'] = partitions
+    manifest['dir'] = rows_dir
+
+def write_cache(city, df, headings, source):
+    """
+    Saves the parsed data of a city partitioned by the columns in
+    PARTITION_BY, as one .npy file per column, plus a manifest holding the
+    partitions and the dictionaries of the coded columns.
+    Args:
+        (str) city - name of the city
+        (dataframe) df - the parsed and derived city data
+        (list) headings - the column headings of the source file
+        (dict) source - the fingerprint of the csv file of the city
+    """
+    path = cache_path(city)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    manifest = { 'version': b_c.CACHE_VERSION,
+                 'sources': [ source ],
+                 'headings': headings,
+                 'rows': len(df.index),
+                 'dictionaries': {},
+                 'columns': [],
+                 'partitions': [],
+                 'generation': 0 }
+
+    # Strings are always stored as categories
+    #
+    for name in df.columns:
+        if df[name].dtype == object:
+            df[name] = df[name].astype('category')
+
+    write_rows(tmp_path, df, manifest, rows_dir(manifest['generation']))
+    write_manifest(tmp_path, manifest)
+
+    # Replace the old cache only once the new one is complete
+    #
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def rows_dir(generation):
+    """
+    Names the directory of the column files written by one update of a cache, e.g. rows-3
+    Args:
+        (int) generation - how many times the cache was updated
+    """
+    return f'rows-{generation}'
+
+def partition_rows(df):
+    """
+    Splits the rows of a city into the partitions of the cache.
+    Args:
+        (dataframe) df - the parsed and derived city data
+    Returns:
+        (list) the key of each partition and the positions of its rows
+    """
+    groups = df.groupby(b_c.PARTITION_BY, observed=True, sort=True).indices
+
+    partitions = []
+    for values, rows in groups.items():
+        values = values if isinstance(values, tuple) else (values,)
+        key = { field_name: to_json(value) for field_name, value in zip(b_c.PARTITION_BY, values) }
+        partitions.append((key, rows))
+
+    return partitions
+
+def write_manifest(path, manifest):
+    """
+    Saves the manifest of a cache, replacing the old one in a single step.
+    Args:
+        (str) path - the directory of the cache
+        (dict) manifest - the manifest to save
+    """
+    with open(os.path.join(path, 'manifest.json.tmp'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+    os.replace(os.path.join(path, 'manifest.json.tmp'), os.path.join(path, 'manifest.json'))
+
+def append_cache(city, df, source):
+    """
+    Adds new rows to the cache of a city.
+
+    Labels not yet in a dictionary are added to its end, so the codes of
+    the rows already cached do not change. The cached rows are mapped from
+    their files and written again with the new ones, so that the rows of
+    each partition stay contiguous, to a new directory which the manifest
+    then points to; runs which mapped the old files can still use them.
+    Only when the station dictionary outgrows the trip code base are the
+    trip codes of the cached rows coded again.
+    Args:
+        (str) city - name of the city
+        (dataframe) df - the parsed and derived new rows
+        (dict) source - the fingerprint of the csv file the rows came from
+    """
+    path = cache_path(city)
+    manifest = read_manifest(city)
+    dictionaries = manifest['dictionaries']
+    columns = { column['name']: column for column in manifest['columns'] }
+    stations = dictionaries[columns['Start Station']['dictionary']]
+    trip_base = b_st.trip_base(len(stations))
+    cached = read_rows(os.path.join(path, manifest['dir']), slice(None), manifest)
+
+    # Code the new rows with the dictionaries of the cache
+    #
+    for name, column in columns.items():
+        if column['kind'] == 'category':
+            labels = dictionaries[column['dictionary']]
+            known = set(labels)
+            labels.extend( sorted( set(df[name].dropna()) - known ) )
+    for name, column in columns.items():
+        if column['kind'] == 'category':
+            dtype = pd.CategoricalDtype(dictionaries[column['dictionary']])
+            df[name] = df[name].astype(object).astype(dtype)
+            cached[name] = pd.Categorical.from_codes(cached[name].cat.codes, dtype=dtype)
+    df['Trip Code'] = b_st.trip_codes(df['Start Station'].cat.codes.to_numpy(),
+                                      df['End Station'].cat.codes.to_numpy(),
+                                      len(stations))
+    df = df[list(columns)]
+    df.index = pd.RangeIndex(manifest['rows'], manifest['rows'] + len(df.index))
+
+    # New stations change every trip code once the base is outgrown
+    #
+    if b_st.trip_base(len(stations)) != trip_base:
+        cached['Trip Code'] = b_st.trip_codes(cached['Start Station'].cat.codes.to_numpy(),
+                                              cached['End Station'].cat.codes.to_numpy(),
+                                              len(stations))
+
+    old_dir = manifest['dir']
+    manifest['generation'] += 1
+    write_rows(path, pd.concat([ cached, df ]), manifest, rows_dir(manifest['generation']))
+    manifest['rows'] += len(df.index)
+    # Keep each source where it is, so that the csv file of the city stays first
+    #
+    paths = [ kept['path'] for kept in manifest['sources'] ]
+    if source['path'] in paths:
+        manifest['sources'][paths.index(source['path'])] = source
+    else:
+        manifest['sources'].append(source)
+
+    write_manifest(path, manifest)
+    shutil.rmtree(os.path.join(path, old_dir), ignore_errors=True)
+
+def clear_cache(city=None):
+    """
+    Removes the cache of a city, or of every city.
+    Args:
+        (str) city - name of the city, or None to remove every city
+    """
+    if city is None:
+        shutil.rmtree(b_c.CACHE_DIR, ignore_errors=True)
+    else:
+        shutil.rmtree(cache_path(city), ignore_errors=True)
+
+
+def main():
+
+    print("Testing: read_cache")
+    for city in b_c.CITY_DATA:
+        df, headings = read_cache(city)
+        if df is None:
+            print(city, '- no cache')
+        else:
+            print(city, '-', f'{len(df.index):,}', 'cached records')
+
+if __name__ == "__main__":
+    main()
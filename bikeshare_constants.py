@@ -4,7 +4,8 @@ CITY_DATA = { 'chicago': 'chicago.csv',
               'new york city': 'new_york_city.csv',
               'washington': 'washington.csv' }
 
-MONTH_NAMES = { '1': 'January', '2': 'February', '3': 'March', '4': 'April', '5': 'May', '6': 'June' }
+MONTH_NAMES = { '1': 'January', '2': 'February', '3': 'March', '4': 'April', '5': 'May', '6': 'June',
+                '7': 'July', '8': 'August', '9': 'September', '10': 'October', '11': 'November', '12': 'December' }
 
 
 DAY_NAMES = { '0': 'Sunday', '1': 'Monday', '2': 'Tuesday', '3': 'Wednesday', '4': 'Thursday', '5': 'Friday', '6': 'Saturday' }
@@ -16,6 +17,10 @@ ACTIONS = [ 'View raw data',
             'Analyze the station data',
             'Analyze the trip duration data',
             'Analyze the users data',
+            'Analyze the bikes in use',
+            'Analyze the station flow',
+            'Analyze the routes',
+            'Analyze the demand by hour',
             'Supply new inputs',
             'Exit' ]
 
@@ -38,4 +43,124 @@ PD_OPTIONS = ('display.width', 132,
 def clear_screen():
   print(chr(27) + "[2J")
 
+# Trips are not stored as strings but coded from the station ids (see bikeshare_stations)
+#
 STATION_FIELDS = [ 'Start Station', 'End Station', 'Trips' ]
+
+# The schema applied while the csv files are parsed
+#
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+TRIP_DTYPES = { 'Trip Duration': 'float64',
+                'Start Station': 'category',
+                'End Station': 'category',
+                'User Type': 'category' }
+
+RIDER_DTYPES = { 'Gender': 'category',
+                 'Birth Year': 'Int16' }
+
+CITY_SCHEMA = { 'chicago': { 'dtypes': { **TRIP_DTYPES, **RIDER_DTYPES },
+                             'times': [ 'Start Time', 'End Time' ],
+                             'time_format': TIME_FORMAT },
+                'new york city': { 'dtypes': { **TRIP_DTYPES, **RIDER_DTYPES },
+                                   'times': [ 'Start Time', 'End Time' ],
+                                   'time_format': TIME_FORMAT },
+                'washington': { 'dtypes': TRIP_DTYPES,
+                                'times': [ 'Start Time', 'End Time' ],
+                                'time_format': TIME_FORMAT } }
+
+# How much memory the unfiltered data of the loaded cities may use
+#
+FRAME_CACHE_BYTES = 2 * 1024**3
+
+# The largest table of counts built densely by the aggregation engine
+#
+DENSE_COUNT_LIMIT = 1 << 22
+
+# How many rows to read at a time when the csv file is streamed
+#
+CHUNK_SIZE = 100000
+
+# Set APPROXIMATE_STATIONS to find the station and trip modes with Space-Saving
+# summaries of TOPK_SIZE codes, merged chunk by chunk, instead of exact counts.
+# A count is then too high by at most the number of trips / TOPK_SIZE. The
+# ranges are then estimated chunk by chunk too, with HyperLogLog sketches of
+# DISTINCT_PRECISION if it is set, otherwise of APPROXIMATE_PRECISION
+#
+APPROXIMATE_STATIONS = False
+TOPK_SIZE = 1024
+APPROXIMATE_PRECISION = 14
+
+# Set DISTINCT_PRECISION, e.g. to 12, to estimate the station ranges with
+# HyperLogLog sketches of 2 ** DISTINCT_PRECISION registers rather than count
+# them exactly; the estimates are within about 1.04 / sqrt(2 ** precision)
+#
+DISTINCT_PRECISION = None
+
+# How many leading values the mode-style statistics find, the start hours,
+# stations, trips and birth years; the reports show the leaders after the
+# mode when it is more than 1
+#
+TOP_N = 1
+
+# The percentiles of the trip duration shown in the duration report. Set
+# APPROXIMATE_DURATIONS to find them from log histograms with DURATION_RESOLUTION
+# buckets per doubling rather than by sorting the durations; the estimates are
+# then within about 2 ** (1 / (2 * DURATION_RESOLUTION)) - 1, e.g. 1.1% for 32
+#
+DURATION_PERCENTILES = [ 50, 90, 95, 99 ]
+APPROXIMATE_DURATIONS = False
+DURATION_RESOLUTION = 32
+
+# The most steps of the curve of bikes in use kept with the analysis
+#
+CONCURRENCY_CURVE_POINTS = 500
+
+# How many of the stations losing and gaining the most bikes the station flow analysis shows
+#
+FLOW_STATIONS = 5
+
+# How many of the most common routes the route analysis shows, and the most
+# common end stations of how many of the busiest start stations
+#
+TOP_ROUTES = 5
+ROUTE_STATIONS = 3
+
+# Set HEATMAP_BY_USER_TYPE to also show the trips by day and hour of each user type
+#
+HEATMAP_BY_USER_TYPE = False
+
+DERIVED_DTYPES = { 'Month': 'int8',
+                   'Day of Week': 'category',
+                   'Year': 'int16',
+                   'Hour': 'int8',
+                   'Year of Birth': 'Int16' }
+
+# Where the parsed city data is cached between runs
+#
+CACHE_DIR = '.bikeshare_cache'
+CACHE_VERSION = 8
+CACHE_BLOCK_SIZE = 1 << 20
+NULLABLE_DTYPES = [ 'Int8', 'Int16', 'Int32', 'Int64' ]
+
+# The columns the cache is partitioned by; add 'Day of Week' to also
+# partition each month by weekday
+#
+PARTITION_BY = [ 'Year', 'Month' ]
+
+# How many analysis results to keep in memory; they are also kept on disk
+# in the city's cache until its data changes. Change RESULTS_VERSION when
+# the results are found or kept differently, so that older ones are not used
+#
+RESULT_CACHE_SIZE = 32
+RESULTS_VERSION = 3
+
+# How many analyses to compute at once in the background after the data is loaded
+#
+PRECOMPUTE_WORKERS = 2
+
+# The dimensions of the aggregate cube kept with the cache of a city; the
+# station counts of the cube are only kept by the filter dimensions
+#
+FILTER_DIMENSIONS = [ 'Year', 'Month', 'Day of Week' ]
+CUBE_DIMENSIONS = FILTER_DIMENSIONS + [ 'Hour', 'User Type', 'Gender', 'Birth Year' ]
@@ -0,0 +1,565 @@
+import os
+import sys
+import threading
+
+# The following tests if the pandas and numpy libraries have been loaded
+#
+try:
+    import pandas as pd
+except ImportError as error:
+    print('\n', '\tpandas has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+import bikeshare_constants as b_c
+import bikeshare_cache as b_ca
+import bikeshare_stations as b_st
+import bikeshare_agg as b_agg
+import bikeshare_kernels as b_k
+import bikeshare_data as b_d
+
+# The cube holds one table of trip counts and duration sums by every
+# dimension in CUBE_DIMENSIONS, plus one sparse table of counts for each
+# station field by the filter columns. Every table is a dict of equal
+# length arrays, one cell per combination which occurs; -1 marks a
+# missing value.
+#
+# The columns of the station tables
+#
+STATION_KEYS = b_c.FILTER_DIMENSIONS + [ 'Code' ]
+
+# The cubes loaded in this session, with the stamp of the data they count
+#
+CUBES = {}
+
+# Guards CUBES, so that the background workers build and save a cube only once
+#
+LOCK = threading.Lock()
+
+
+def dimension_codes(df):
+    """
+    Codes every dimension of the cube as a small integer.
+    Args:
+        (dataframe) df - the data of a city
+    Returns:
+        (dict) the codes of each dimension, by name
+        (dict) the labels of the coded dimensions, by name
+    """
+    codes = { 'Year': df['Year'].to_numpy(np.int16),
+              'Month': df['Month'].to_numpy(np.int16),
+              'Day of Week': df['Day of Week'].cat.codes.to_numpy(np.int16),
+              'Hour': (df['Hour'] if 'Hour' in df else b_d.derive_hour(df)).to_numpy(np.int16) }
+    labels = {}
+
+    # Rider fields which a city does not collect are missing for every trip
+    #
+    for field_name in [ 'User Type', 'Gender' ]:
+        if field_name in df:
+            values = df[field_name]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+            codes[field_name] = values.cat.codes.to_numpy(np.int16)
+            labels[field_name] = np.array(values.cat.categories, dtype=str)
+        else:
+            codes[field_name] = np.full(len(df.index), -1, dtype=np.int16)
+            labels[field_name] = np.array([], dtype=str)
+
+    if 'Birth Year' in df:
+        birth_years = df['Year of Birth'] if 'Year of Birth' in df else b_d.derive_year_of_birth(df)
+        codes['Birth Year'] = birth_years.to_numpy(np.int16, na_value=-1)
+    else:
+        codes['Birth Year'] = np.full(len(df.index), -1, dtype=np.int16)
+
+    return codes, labels
+
+def build_cube(df):
+    """
+    Rolls the trips of a city up into the cells of the cube.
+    Args:
+        (dataframe) df - the data of a city
+    Returns:
+        (dict) the tables of the cube, by name
+    """
+    codes, labels = dimension_codes(df)
+
+    cells = pd.DataFrame(codes)
+    cells['Trip Duration'] = df['Trip Duration'].to_numpy()
+    sums = cells.groupby(b_c.CUBE_DIMENSIONS, sort=True)['Trip Duration'].agg(['size', 'count', 'sum'])
+
+    cube = { 'cells': { name: sums.index.get_level_values(name).to_numpy(np.int16)
+                        for name in b_c.CUBE_DIMENSIONS } }
+    cube['cells']['Trips'] = sums['size'].to_numpy(np.int64)
+    cube['cells']['Timed'] = sums['count'].to_numpy(np.int64)
+    cube['cells']['Duration'] = sums['sum'].to_numpy(np.float64)
+
+    # Station counts only keep the combinations which occur
+    #
+    for field_name in b_c.STATION_FIELDS:
+        field, _ = b_st.field_codes(df, field_name)
+        keys = { name: codes[name] for name in b_c.FILTER_DIMENSIONS }
+        keys['Code'] = field.astype(np.int64)
+        counts = pd.DataFrame(keys)[field >= 0].groupby(STATION_KEYS, sort=True).size()
+
+        cube[field_name] = { name: counts.index.get_level_values(name).to_numpy()
+                             for name in STATION_KEYS }
+        cube[field_name]['Trips'] = counts.to_numpy(np.int64)
+
+    labels['Station'] = np.array(b_st.station_names(df), dtype=str)
+    cube['labels'] = labels
+
+    return cube
+
+def merge_cubes(cube, other):
+    """
+    Adds the cells of one cube to another, such as the cube of newly
+    ingested trips to the cube of a city. The labels of the second cube
+    must extend those of the first, as the dictionaries of the cache do.
+    Args:
+        (dict) cube - the cube of the trips already counted
+        (dict) other - the cube of the new trips
+    Returns:
+        (dict) the merged cube
+    """
+    tables = { table: cube[table] for table in [ 'cells' ] + b_c.STATION_FIELDS }
+
+    # More stations can change the trip codes of the cells already counted
+    #
+    old_base = b_st.trip_base(len(cube['labels']['Station']))
+    new_base = b_st.trip_base(len(other['labels']['Station']))
+    if old_base != new_base:
+        start, end = np.divmod(tables['Trips']['Code'], old_base)
+        tables['Trips'] = dict(tables['Trips'], Code=start * new_base + end)
+
+    merged = { 'labels': other['labels'] }
+    for table, old_cells in tables.items():
+        keys = b_c.CUBE_DIMENSIONS if table == 'cells' else STATION_KEYS
+        both = pd.concat([ pd.DataFrame(old_cells), pd.DataFrame(other[table]) ])
+        sums = both.groupby(keys, sort=True).sum()
+        merged[table] = { name: sums.index.get_level_values(name).to_numpy() for name in keys }
+        for name in sums.columns:
+            merged[table][name] = sums[name].to_numpy()
+
+    return merged
+
+def cube_path(city):
+    """
+    Returns the file of the cube of a city, which is kept with its cache.
+    Args:
+        (str) city - name of the city
+    """
+    return os.path.join(b_ca.cache_path(city), 'cube.npz')
+
+def save_cube(city, cube, manifest):
+    """
+    Saves the cube of a city next to its cache.
+    Args:
+        (str) city - name of the city
+        (dict) cube - the tables of the cube
+        (dict) manifest - the manifest of the cache it was built from
+    """
+    arrays = { 'stamp': np.array(b_ca.data_stamp(manifest)) }
+    for table, columns in cube.items():
+        for name, values in columns.items():
+            arrays[table + ':' + name] = values
+
+    with open(cube_path(city) + '.tmp', 'wb') as cube_file:
+        np.savez(cube_file, **arrays)
+    os.replace(cube_path(city) + '.tmp', cube_path(city))
+
+def read_cube(city, manifest):
+    """
+    Reads the cube of a city.
+    Args:
+        (str) city - name of the city
+        (dict) manifest - the current manifest of the city's cache
+    Returns:
+        (dict) the tables of the cube, or None if it is missing or out of date
+    """
+    try:
+        with np.load(cube_path(city), allow_pickle=False) as arrays:
+            if str(arrays['stamp']) != b_ca.data_stamp(manifest):
+                return None
+            cube = {}
+            for key in arrays.files:
+                if key != 'stamp':
+                    table, name = key.split(':', 1)
+                    cube.setdefault(table, {})[name] = arrays[key]
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return cube
+
+def load_cube(city):
+    """
+    Returns the cube of a city, building it from the cached data when it
+    is missing or out of date.
+    Args:
+        (str) city - name of the city
+    Returns:
+        (dict) the tables of the cube
+    """
+    with LOCK:
+        return load_stamped_cube(city)[1]
+
+def load_stamped_cube(city):
+    """
+    Returns the cube of a city with the stamp of the data it counts, which
+    is None when the data could not be cached. The caller holds LOCK.
+    Args:
+        (str) city - name of the city
+    Returns:
+        (str) the stamp
+        (dict) the tables of the cube
+    """
+    try:
+        b_d.update_cache(city)
+    except OSError:
+        pass
+    manifest = b_ca.read_manifest(city)
+    stamp = b_ca.data_stamp(manifest) if manifest else None
+
+    # Use the cube already loaded in this session while the data is unchanged
+    #
+    if city in CUBES and stamp is not None and CUBES[city][0] == stamp:
+        return CUBES[city]
+
+    cube = read_cube(city, manifest) if manifest else None
+    if cube is None:
+        # The data in memory may be older than the cache, so only save the
+        # cube when it counts the data the manifest describes
+        #
+        df, _ = b_d.read_frame(city)
+        cube = build_cube(df)
+        if stamp is not None and df.attrs.get('stamp') != stamp:
+            stamp = df.attrs.get('stamp')
+        elif manifest:
+            save_cube(city, cube, manifest)
+    CUBES[city] = (stamp, cube)
+
+    return CUBES[city]
+
+def selected_cube(df, city, month='all', day='all', year='all'):
+    """
+    Returns the cells of the cube of a city which pass the filters, when the
+    cube counts the same data the filtered rows were read from.
+    Args:
+        (dataframe) df - the filtered data
+        (str) city - name of the city
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        (dict) the selected cube, or None if the statistics must come from the rows
+    """
+    stamp = df.attrs.get('stamp')
+    if stamp is None:
+        return None
+
+    try:
+        with LOCK:
+            cube_stamp, cube = load_stamped_cube(city)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    if cube_stamp != stamp:
+        return None
+
+    return select(cube, month, day, year)
+
+def update_cube(city, df, manifest):
+    """
+    Adds newly ingested trips to the saved cube of a city, if it has one.
+    Args:
+        (str) city - name of the city
+        (dataframe) df - the new trips, coded with the dictionaries of the cache
+        (dict) manifest - the manifest of the cache before the trips were added
+    """
+    cube = read_cube(city, manifest)
+    if cube is not None:
+        save_cube(city, merge_cubes(cube, build_cube(df)), b_ca.read_manifest(city))
+
+def select(cube, month='all', day='all', year='all'):
+    """
+    Keeps the cells of a cube which pass the filters.
+    Args:
+        (dict) cube - the tables of the cube
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        (dict) the cube holding only the cells which pass
+    """
+    where = b_d.filter_values(month, day, year)
+    if 'Day of Week' in where:
+        where['Day of Week'] = list(b_c.DAY_NAMES.values()).index(where['Day of Week'])
+
+    selected = { 'labels': cube['labels'] }
+    for table, columns in cube.items():
+        if table != 'labels':
+            keep = np.ones(len(columns['Trips']), dtype=bool)
+            for name, value in where.items():
+                keep &= columns[name] == value
+            selected[table] = { name: values[keep] for name, values in columns.items() }
+
+    return selected
+
+def cell_groups(columns, group_field):
+    """
+    Codes the groups of the cells of a table as 0, 1, 2, ...
+    Args:
+        (dict) columns - a table of the cube
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+    Returns:
+        (array) the group code of each cell
+        (list) the label of each group code, in display order
+    """
+    if group_field is None:
+        return np.zeros(len(columns['Trips']), dtype=np.int8), [ 'All' ]
+
+    if group_field == 'Day of Week':
+        return columns[group_field], list(b_c.DAY_NAMES.values())
+
+    labels, codes = np.unique(columns[group_field], return_inverse=True)
+
+    return codes, list(labels)
+
+def grouped_totals(columns, group_field, codes, size):
+    """
+    Rolls the trip counts of the cells up by group and by the codes of one field.
+    Args:
+        (dict) columns - a table of the cube
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+        (array) codes - the code of each cell, -1 where missing
+        (int) size - how many different codes there can be
+    Returns:
+        (array) the count of each code, one row per group
+        (list) the label of each row
+    """
+    groups, labels = cell_groups(columns, group_field)
+
+    return b_k.grouped_histograms(groups, len(labels), codes, size, weights=columns['Trips']), labels
+
+def int_stats_by(cube, field_name, group_field, top_n=1):
+    """
+    Finds the statistics of an integer dimension, such as Hour or Birth
+    Year, in the same form as b_k.int_stats_by.
+    Args:
+        (dict) cube - the selected cube
+        (str) field_name - the dimension
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+        (int) top_n - how many leading values to find
+    Returns:
+        (dict) the IntStats of each group label which has any values
+    """
+    cells = cube['cells']
+    values = cells[field_name].astype(np.int64)
+    known = values >= 0
+    if not known.any():
+        return {}
+
+    first = int(values[known].min())
+    codes = np.where(known, values - first, -1)
+    histograms, labels = grouped_totals(cells, group_field, codes, int(codes.max()) + 1)
+
+    results = {}
+    for label, histogram in zip(labels, histograms):
+        stats = b_k.histogram_stats(histogram, first, top_n)
+        if stats is not None:
+            results[label] = stats
+
+    return results
+
+def duration_by(cube, group_field):
+    """
+    Finds the total and mean trip duration in seconds.
+    Args:
+        (dict) cube - the selected cube
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+    Returns:
+        (dict) the (sum, mean) of each group label which occurs
+    """
+    cells = cube['cells']
+    groups, labels = cell_groups(cells, group_field)
+    trips = np.bincount(groups, weights=cells['Trips'], minlength=len(labels))
+    timed = np.bincount(groups, weights=cells['Timed'], minlength=len(labels))
+    durations = np.bincount(groups, weights=cells['Duration'], minlength=len(labels))
+
+    return { label: (durations[ix], durations[ix] / timed[ix] if timed[ix] else np.nan)
+             for ix, label in enumerate(labels) if trips[ix] }
+
+def value_counts_by(cube, field_name, group_field):
+    """
+    Counts the trips of each value of a rider field.
+    Args:
+        (dict) cube - the selected cube
+        (str) field_name - 'User Type' or 'Gender'
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+    Returns:
+        (dict) the counts of each value, largest first, of each group label
+               which has any
+    """
+    names = cube['labels'][field_name]
+    cells = cube['cells']
+    totals, labels = grouped_totals(cells, group_field, cells[field_name].astype(np.int64), max(len(names), 1))
+
+    results = {}
+    for label, row in zip(labels, totals):
+        counts = pd.Series(row[:len(names)], index=names)
+        counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+        if len(counts):
+            results[label] = counts
+
+    return results
+
+def breakdown_by(cube, group_field, field_name):
+    """
+    Counts every value of a rider field and its share of the trips with
+    the field known, in the same form as b_agg.breakdown_by.
+    Args:
+        (dict) cube - the selected cube
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+        (str) field_name - 'User Type' or 'Gender'
+    Returns:
+        (Breakdown) the counts and percentages
+    """
+    names = list(cube['labels'][field_name])
+    cells = cube['cells']
+    counts, labels = grouped_totals(cells, group_field, cells[field_name].astype(np.int64), max(len(names), 1))
+    counts = counts[:, :len(names)].astype(np.int64)
+
+    # Missing values count towards neither the counts nor the totals
+    #
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percentages = np.round(counts / counts.sum(axis=1, keepdims=True) * 100, 1)
+
+    groups, _ = cell_groups(cells, group_field)
+    occurs = np.bincount(groups.astype(np.int64), weights=cells['Trips'], minlength=len(labels)) > 0
+
+    return b_agg.Breakdown([ label for label, occurs_g in zip(labels, occurs) if occurs_g ], names,
+                           counts[occurs], percentages[occurs])
+
+def field_stats_by(cube, group_field, fields, top_n=1):
+    """
+    Finds the mode, top count and number of different values of the
+    station fields, in the same form as b_agg.field_stats_by.
+    Args:
+        (dict) cube - the selected cube
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+        (list) fields - the station fields, e.g. STATION_FIELDS
+        (int) top_n - how many leading values of each field to find
+    Returns:
+        (dict) the FieldStats of each field, by field name, for each group label
+    """
+    names = pd.Index(cube['labels']['Station'])
+    results = {}
+
+    for field_name in fields:
+        columns = cube[field_name]
+        groups, labels = cell_groups(columns, group_field)
+        if field_name == 'Trips':
+            size = b_st.trip_base(len(names)) ** 2
+            name_of = lambda code: b_st.trip_name(code, names)
+        else:
+            size = len(names)
+            name_of = lambda code: names[code]
+        field_stats = b_agg.mode_stats_by(groups, labels, columns['Code'], size, name_of,
+                                          weights=columns['Trips'], top_n=top_n)
+        for label, field in field_stats.items():
+            results.setdefault(label, {})[field_name] = field
+
+    return results
+
+def raw_groups(df, group_field):
+    """
+    Splits the raw data the way the statistics do.
+    Args:
+        (dataframe) df - the filtered data
+        (str) group_field - 'Month', 'Day of Week', or None for a single group
+    Returns:
+        the label and rows of each group which occurs
+    """
+    if group_field is None:
+        return [ ('All', df) ] if len(df.index) else []
+
+    return list(df.groupby(group_field, observed=True))
+
+def check_cube(city, month='all', day='all', year='all'):
+    """
+    Compares every statistic answered from the cube with the same
+    statistic computed from the raw rows.
+    Args:
+        (str) city - name of the city
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        (list) a description of each statistic which differs
+    """
+    cube = select(load_cube(city), month, day, year)
+    df = b_d.filter_data(b_d.read_data(city, month, day, year), month, day, year)
+    b_d.require(df, 'Hour')
+    if 'Birth Year' in df:
+        b_d.require(df, 'Year of Birth')
+
+    differences = []
+    def compare(name, group_field, from_cube, from_rows):
+        if from_cube != from_rows:
+            differences.append(f'{name} by {group_field or "all"}: cube {from_cube} != rows {from_rows}')
+
+    for group_field in [ None, 'Month', 'Day of Week' ]:
+        groups = raw_groups(df, group_field)
+
+        compare('Hour', group_field,
+                { label: stats[:2] for label, stats in int_stats_by(cube, 'Hour', group_field).items() },
+                { label: (int(rows['Hour'].mode()[0]), int(rows['Hour'].value_counts().iloc[0]))
+                  for label, rows in groups })
+
+        compare('Stations', group_field, field_stats_by(cube, group_field, b_c.STATION_FIELDS),
+                b_agg.field_stats_by(df, group_field, b_c.STATION_FIELDS))
+
+        # Sums of floats may differ in the last bits as they are added in another order
+        #
+        durations = duration_by(cube, group_field)
+        for label, rows in groups:
+            total, mean = durations.get(label, (np.nan, np.nan))
+            from_rows = (rows['Trip Duration'].sum(), rows['Trip Duration'].mean())
+            if not np.allclose([ total, mean ], from_rows, rtol=1e-9, equal_nan=True):
+                compare(f'Trip Duration ({label})', group_field, (total, mean), from_rows)
+
+        for field_name in [ 'User Type', 'Gender' ]:
+            if field_name in df:
+                from_rows = {}
+                for label, rows in groups:
+                    counts = rows[field_name].value_counts()
+                    if counts.sum():
+                        from_rows[label] = counts[counts > 0].to_dict()
+                compare(field_name, group_field,
+                        { label: counts.to_dict() for label, counts in value_counts_by(cube, field_name, group_field).items() },
+                        from_rows)
+
+        if 'Birth Year' in df:
+            compare('Birth Year', group_field,
+                    { label: (stats.mode, stats.min, stats.max)
+                      for label, stats in int_stats_by(cube, 'Birth Year', group_field).items() },
+                    { label: (int(rows['Year of Birth'].mode()[0]), int(rows['Year of Birth'].min()),
+                              int(rows['Year of Birth'].max()))
+                      for label, rows in groups if rows['Year of Birth'].count() })
+
+    return differences
+
+
+def main():
+
+    print("Testing: check_cube")
+    for city in b_c.CITY_DATA:
+        for month, day in [ ('all', 'all'), ('june', 'all'), ('all', 'monday') ]:
+            differences = check_cube(city, month, day)
+            print(city, month, day, '-', 'matches the raw data' if not differences else differences)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+import os
 import time
 import sys
+import threading
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 try:
@@ -14,11 +18,21 @@ except ModuleNotFoundError as error:
     print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
     sys.exit()
 
-import bikeshare_inputs as b_i
 import bikeshare_constants as b_c
+import bikeshare_cache as b_ca
+import bikeshare_stations as b_st
+import bikeshare_cube as b_cube
 
+# The unfiltered data of the cities loaded in this session, least recently used first
+#
+FRAMES = OrderedDict()
+FRAMES_LOCK = threading.Lock()
 
-def show_data(df, city, month, day, row=0, increment=5):
+# The loads of whole cities started while the user is still choosing the filters
+#
+PREFETCH = {}
+
+def show_data(df, city, month, day, row=0, increment=5, year='all'):
     """
     Shows data for the specified city
     Args:
@@ -28,16 +42,23 @@ def show_data(df, city, month, day, row=0, increment=5):
         (str) day - the day if inputed by the user
         (int) row - the row number on which to display the data
         (int) increment - how many rows to display
+        (str) year - the year if inputed by the user
     """
+    # The prompts are only imported here, so that the data can be used without the bullet UI
+    #
+    import bikeshare_inputs as b_i
+
     view = True
-    # create a datafrane in order to show the row numbers of the filtered dataset
+    # create a datafrane in order to show the row numbers of the filtered dataset,
+    # in the order of the csv file rather than the partition order of the cache
     #
-    tmp = df.reset_index()
+    tmp = df.sort_index(kind='stable').reset_index()
 
     stats = [{}]
     inputs = pd.DataFrame( stats, index = ['Inputs: '] )
 
     inputs['City'] = city.title()
+    inputs['Year'] = year.title()
     inputs['Month'] = month.title()
     inputs['Day'] = day.title()
     inputs['Number of Records'] = f'{len(df.index):,}'
@@ -108,56 +129,462 @@ def show_data(df, city, month, day, row=0, increment=5):
                 end_col += incre_col
         print()
 
-def load_data(city, month, day):
+def parse_times(df, schema):
     """
-    Loads data for the specified city and filters by month and day if applicable.
+    Converts the time columns of a city to datetime.
     Args:
-        (str) city - name of the city to analyze
+        (dataframe) df - the data read from the csv file
+        (dict) schema - the schema of the city
+    """
+    for field_name in schema['times']:
+        if field_name in df:
+            df[field_name] = pd.to_datetime(df[field_name], format=schema['time_format'])
+
+def derive_filter_columns(df):
+    """
+    Derives the columns which the year, month and day filters use.
+    Args:
+        (dataframe) df - the data with Start Time parsed
+    """
+    # extract year, month and day of week from Start Time to create new columns
+    df['Month'] = df['Start Time'].dt.month.astype(b_c.DERIVED_DTYPES['Month'])
+    #
+    try:
+        day_names = df['Start Time'].dt.weekday_name
+    except AttributeError:
+        day_names = df['Start Time'].dt.day_name()
+    df['Day of Week'] = pd.Categorical(day_names, categories=list(b_c.DAY_NAMES.values()))
+    #
+    df['Year'] = df['Start Time'].dt.year.astype(b_c.DERIVED_DTYPES['Year'])
+
+def derive_hour(df):
+    """
+    Returns the hour of the Start Time of each trip.
+    Args:
+        (dataframe) df - the data with Start Time parsed
+    """
+    return df['Start Time'].dt.hour.astype(b_c.DERIVED_DTYPES['Hour'])
+
+def derive_year_of_birth(df):
+    """
+    Returns the birth year of each rider as a nullable integer.
+    Args:
+        (dataframe) df - the data of a city which has Birth Year
+    """
+    return df['Birth Year'].astype(b_c.DERIVED_DTYPES['Year of Birth'])
+
+# The columns which are only derived when a statistic first needs them
+#
+LAZY_COLUMNS = { 'Hour': derive_hour,
+                 'Year of Birth': derive_year_of_birth }
+
+def require(df, *field_names):
+    """
+    Derives the lazy columns which are not yet in the data, keeping them
+    in the dataframe so that they are only derived once.
+    Args:
+        (dataframe) df - the data of a city
+        (str) field_names - the columns which are needed
+    Returns:
+        df - the same dataframe, holding the columns
+    """
+    # The data is often a filtered view, so do not warn about adding to it
+    #
+    missing = [ field_name for field_name in field_names if field_name not in df ]
+    if missing:
+        with pd.option_context('mode.chained_assignment', None):
+            for field_name in missing:
+                df[field_name] = LAZY_COLUMNS[field_name](df)
+
+    return df
+
+def parse_file(file_name, schema, skip_rows=0):
+    """
+    Reads a csv file of trips and derives the columns used by the analysis.
+    Args:
+        (str) file_name - the csv file to parse
+        (dict) schema - the schema of the city
+        (int) skip_rows - how many rows after the headings were already read
+    Returns:
+        df - Pandas DataFrame containing the trips of the file
+        (list) the column headings of the csv file
+    """
+    # load data file into a dataframe using the schema of the city
+    skip = range(1, skip_rows + 1) if skip_rows else None
+    df = pd.read_csv(file_name, dtype=schema['dtypes'], skiprows=skip)
+
+    # convert the Start Time and End Time columns to datetime
+    parse_times(df, schema)
+
+    headings = sorted( list(df.columns), key=str.casefold)
+
+    derive_filter_columns(df)
+
+    # Code the stations and trips as integers
+    #
+    b_st.encode_stations(df)
+
+    return df, headings
+
+def parse_data(city):
+    """
+    Reads the csv file of a city and derives the columns used by the analysis.
+    Args:
+        (str) city - name of the city to parse
+    Returns:
+        df - Pandas DataFrame containing all of the city data
+        (list) the column headings of the csv file
+    """
+    return parse_file(b_c.CITY_DATA[city], b_c.CITY_SCHEMA[city])
+
+def update_cache(city):
+    """
+    Brings the cache of a city up to date with its csv files.
+
+    Rows added to the end of a csv file are ingested on their own; any
+    other change to a file builds the whole cache again, ingesting once
+    more the files which had been added to it.
+    Args:
+        (str) city - name of the city
+    """
+    manifest = b_ca.read_manifest(city)
+    statuses = [ b_ca.source_status(source) for source in manifest['sources'] ] if manifest else [ 'stale' ]
+
+    if 'stale' in statuses:
+        df, headings = parse_data(city)
+        b_ca.write_cache(city, df, headings, b_ca.fingerprint(b_c.CITY_DATA[city], len(df.index)))
+        with FRAMES_LOCK:
+            FRAMES.pop(city, None)
+        # Ingest once more every file added to the old cache, wherever it is listed
+        #
+        for source in (manifest['sources'] if manifest else []):
+            if source['path'] != os.path.abspath(b_c.CITY_DATA[city]) and os.path.exists(source['path']):
+                ingest(city, source['path'])
+        return
+
+    for source, status in zip(manifest['sources'], statuses):
+        if status == 'extended':
+            ingest(city, source['path'])
+
+def ingest(city, file_name):
+    """
+    Adds the trips of a csv file to the cache of a city, such as the data of
+    a new month. Ingesting a file again only adds the rows appended to it.
+    Args:
+        (str) city - name of the city
+        (str) file_name - the csv file of new trips
+    Returns:
+        (int) how many rows were added
+    """
+    manifest = b_ca.read_manifest(city)
+    if manifest is None:
+        update_cache(city)
+        manifest = b_ca.read_manifest(city)
+
+    skip_rows = 0
+    for source in manifest['sources']:
+        if source['path'] == os.path.abspath(file_name):
+            status = b_ca.source_status(source)
+            if status == 'fresh':
+                return 0
+            if status == 'stale':
+                # The file was changed, not extended, so build the cache again
+                #
+                update_cache(city)
+                return sum( source['rows'] for source in b_ca.read_manifest(city)['sources']
+                            if source['path'] == os.path.abspath(file_name) )
+            skip_rows = source['rows']
+
+    df, _ = parse_file(file_name, b_c.CITY_SCHEMA[city], skip_rows)
+    b_ca.append_cache(city, df, b_ca.fingerprint(file_name, skip_rows + len(df.index)))
+    b_cube.update_cube(city, df, manifest)
+
+    with FRAMES_LOCK:
+        FRAMES.pop(city, None)
+
+    return len(df.index)
+
+def stream_data(city, month, day, chunksize=b_c.CHUNK_SIZE, year='all'):
+    """
+    Reads the csv file of a city in chunks, keeping only the rows which pass the filters.
+    Files added with ingest are not read. The rows are ordered by the columns
+    in PARTITION_BY and then as in the csv file, as the cache holds them.
+    Args:
+        (str) city - name of the city to read
         (str) month - name of the month to filter by, or "all" to apply no month filter
         (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (int) chunksize - how many rows to read at a time
+        (str) year - the year to filter by, or "all" to apply no year filter
     Returns:
         df - Pandas DataFrame containing city data filtered by month and day
     """
+    schema = b_c.CITY_SCHEMA[city]
+    categorical = [ field_name for field_name, dtype in schema['dtypes'].items() if dtype == 'category' ]
+    categories = { field_name: set() for field_name in categorical }
+    chunks = []
+    empty = None
+    headings = []
+
+    for chunk in pd.read_csv(b_c.CITY_DATA[city], dtype=schema['dtypes'], chunksize=chunksize):
+        parse_times(chunk, schema)
+        headings = sorted( list(chunk.columns), key=str.casefold)
+        #
+        # Remember every category seen, so that the categories match the full read
+        #
+        for field_name in categorical:
+            if field_name in chunk:
+                categories[field_name].update(chunk[field_name].cat.categories)
+        #
+        derive_filter_columns(chunk)
+        chunk = filter_data(chunk, month, day, year).copy()
+        if len(chunk.index):
+            chunks.append(chunk)
+        else:
+            empty = chunk
 
-    # load data file into a dataframe
-    df = pd.read_csv(b_c.CITY_DATA[city])
+    df = pd.concat(chunks) if chunks else empty
 
-    # convert the Start Time column to datetime
-    df['Start Time'] = pd.to_datetime(df['Start Time'])
+    # Chunks with different categories are concatenated as objects
+    #
+    for field_name in categorical:
+        if field_name in df:
+            dtype = pd.CategoricalDtype(sorted(categories[field_name]))
+            df[field_name] = df[field_name].astype(object).astype(dtype)
 
-    b_c.COLUMN_HEADINGS = sorted( list(df.columns), key=str.casefold)
+    b_st.encode_stations(df)
 
-    # extract month and day of week from Start Time to create new columns
-    df['Month'] = df['Start Time'].dt.month
+    # Order the rows as the cache does, by partition and then as in the csv file
     #
-    try:
-        df['Day of Week'] = df['Start Time'].dt.weekday_name
-    except AttributeError:
-        df['Day of Week'] = df['Start Time'].dt.day_name()
+    df = df.sort_values(b_c.PARTITION_BY, kind='stable')
+
+    b_c.COLUMN_HEADINGS = headings
+
+    return df
+
+def read_data(city, month='all', day='all', year='all'):
+    """
+    Returns the parsed data of a city, from memory or the cache when it is up
+    to date, and makes its column headings the ones shown by show_data.
+    Args:
+        (str) city - name of the city to read
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        df - Pandas DataFrame containing the city data
+    """
+    df, headings = read_frame(city, month, day, year)
+
+    b_c.COLUMN_HEADINGS = headings
+
+    return df
+
+def read_frame(city, month='all', day='all', year='all'):
+    """
+    Returns the parsed data of a city, from memory or the cache when it is up to date.
+
+    When the data is read from the cache only the partitions holding the
+    rows which pass the filters are read, so the frame can still hold rows
+    that filter_data must remove. The column headings shown are left as they
+    are, so that threads working in the background can call it.
+    Args:
+        (str) city - name of the city to read
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        df - Pandas DataFrame containing the city data
+        (list) the column headings of the csv file
+    """
+    # Use the data already loaded in this session
     #
-    df['Hour'] = df['Start Time'].dt.hour
-    df['Year'] = df['Start Time'].dt.year
+    with FRAMES_LOCK:
+        if city in FRAMES:
+            FRAMES.move_to_end(city)
+            return FRAMES[city]
+
+    try:
+        update_cache(city)
+        df, headings = b_ca.read_cache(city, filter_values(month, day, year))
+    except OSError:
+        print('The parsed data could not be cached.\n')
+        df = None
+
+    # Parse the csv file when the cache cannot be used
     #
-    df['Trips'] = df['Start Station'] + '->' + df['End Station']
+    if df is None:
+        df, headings = parse_data(city)
+        keep_frame(city, df, headings)
+
+    # Only keep the data of the whole city in memory
     #
-    try:
-        df['Year of Birth'] = df['Birth Year'].dropna().astype(int)
-    except:
-        print()
+    elif month == 'all' and day == 'all' and year == 'all':
+        keep_frame(city, df, headings)
+
+    return df, headings
+
+def frame_size(df):
+    """
+    Returns how many bytes of memory a dataframe uses.
+    Args:
+        (dataframe) df - the data of a city
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def keep_frame(city, df, headings):
+    """
+    Keeps the data of a city in memory, evicting the least recently used
+    cities once the memory budget is exceeded.
+    Args:
+        (str) city - name of the city
+        (dataframe) df - the unfiltered data of the city
+        (list) headings - the column headings of the csv file
+    """
+    with FRAMES_LOCK:
+        FRAMES[city] = (df, headings)
+        FRAMES.move_to_end(city)
+
+        total = sum( frame_size(frame) for frame, _ in FRAMES.values() )
+        while FRAMES and total > b_c.FRAME_CACHE_BYTES:
+            _, (frame, _) = FRAMES.popitem(last=False)
+            total -= frame_size(frame)
+
+def clear_frames():
+    """
+    Forgets the data of every city loaded in this session.
+    """
+    with FRAMES_LOCK:
+        FRAMES.clear()
+
+def filter_values(month, day, year='all'):
+    """
+    Returns the value of Year, Month and Day of Week which the filters select.
+    Args:
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        (dict) the value of each filtered column
+    """
+    values = {}
+
+    if year != 'all':
+        values['Year'] = int(year)
 
-    # filter by month if applicable
     if month != 'all':
         # use the index of the months list to get the corresponding int
         months = list( b_c.MONTH_NAMES.values() )
-        month = months.index(month.title()) + 1
+        values['Month'] = months.index(month.title()) + 1
+
+    if day != 'all':
+        values['Day of Week'] = day.title()
+
+    return values
 
+def filter_data(df, month, day, year='all'):
+    """
+    Filters the data of a city by year, month and day if applicable.
+    Args:
+        (dataframe) df - the data of the city
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        df - Pandas DataFrame containing city data filtered by month and day,
+             with the filters in df.attrs['filters']
+    """
+    values = filter_values(month, day, year)
+
+    # filter by year if applicable
+    if 'Year' in values:
+        df = df[df['Year'] == values['Year']]
+
+    # filter by month if applicable
+    if 'Month' in values:
         # filter by month to create the new dataframe
-        df = df[df['Month'] == month]
+        df = df[df['Month'] == values['Month']]
 
     # filter by day of week if applicable
-    if day != 'all':
+    if 'Day of Week' in values:
         # filter by day of week to create the new dataframe
-        df = df[df['Day of Week'] == day.title()]
+        df = df[df['Day of Week'] == values['Day of Week']]
+
+    # Record the filters, so that what is derived from the frame can be kept
+    # along with the stamp it was read with
+    #
+    df.attrs['filters'] = [ month, day, str(year) ]
+
+    return df
+
+def prefetch(city):
+    """
+    Starts loading the whole data of a city in the background, so that it is
+    ready by the time the user has chosen the filters.
+    Args:
+        (str) city - name of the city
+    """
+    if city not in PREFETCH:
+        executor = ThreadPoolExecutor(max_workers=1)
+        PREFETCH[city] = executor.submit(read_frame, city)
+        executor.shutdown(wait=False)
+
+def wait_prefetch(city):
+    """
+    Waits for the background load of a city, if one was started.
+    Args:
+        (str) city - name of the city
+    """
+    if city in PREFETCH:
+        take_prefetch(city, keep=True)
+
+def take_prefetch(city, keep=False):
+    """
+    Returns the data of a city loaded in the background, waiting for it if
+    the load has not finished, and makes its column headings the ones shown
+    by show_data.
+    Args:
+        (str) city - name of the city
+        (boolean) keep - leave the load to be taken again
+    Returns:
+        df - the unfiltered data of the city, or None if it was not prefetched
+             or the load failed
+    """
+    future = PREFETCH.get(city) if keep else PREFETCH.pop(city, None)
+    if future is None:
+        return None
+
+    try:
+        df, headings = future.result()
+    except (OSError, ValueError, KeyError):
+        return None
+
+    b_c.COLUMN_HEADINGS = headings
+
+    return df
+
+def load_data(city, month, day, chunksize=None, year='all'):
+    """
+    Loads data for the specified city and filters by month and day if applicable.
+    Args:
+        (str) city - name of the city to analyze
+        (str) month - name of the month to filter by, or "all" to apply no month filter
+        (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (int) chunksize - stream the csv file this many rows at a time, filtering
+                          as it is read, instead of loading the whole city
+        (str) year - the year to filter by, or "all" to apply no year filter
+    Returns:
+        df - Pandas DataFrame containing city data filtered by month and day
+    """
+    if chunksize:
+        PREFETCH.pop(city, None)
+        df = stream_data(city, month, day, chunksize, year)
+    else:
+        # Use the whole city when it was prefetched, otherwise read what the filters need
+        #
+        df = take_prefetch(city)
+        if df is None:
+            df = read_data(city, month, day, year)
+        df = filter_data(df, month, day, year)
 
     b_c.clear_screen() # print a set of characters to clear the screen
 
@@ -165,12 +592,119 @@ def load_data(city, month, day):
 
     return df
 
+def memory_usage(df):
+    """
+    Compares the memory used by the typed columns with what they would use untyped.
+    Args:
+        (dataframe) df - the data of a city
+    Returns:
+        usage - Pandas DataFrame of the bytes used per column, untyped and typed
+    """
+    usage = pd.DataFrame( index = df.columns, columns = ['Untyped', 'Typed', 'Saved'] )
+
+    for field_name in df.columns:
+        typed = df[field_name]
+        #
+        # Strings were held as objects, and every number as a 64 bit value
+        #
+        if isinstance(typed.dtype, pd.CategoricalDtype):
+            untyped = typed.astype(object)
+        elif pd.api.types.is_extension_array_dtype(typed.dtype):
+            untyped = typed.astype('float64')
+        elif pd.api.types.is_integer_dtype(typed.dtype):
+            untyped = typed.astype('int64')
+        else:
+            untyped = typed
+        usage.loc[field_name, 'Untyped'] = untyped.memory_usage(index=False, deep=True)
+        usage.loc[field_name, 'Typed'] = typed.memory_usage(index=False, deep=True)
+
+    usage.loc['Total'] = usage.sum()
+    usage['Saved'] = usage['Untyped'] - usage['Typed']
+
+    return usage
+
+def show_memory_usage(df):
+    """
+    Prints the bytes saved per column by the schema of the city.
+    Args:
+        (dataframe) df - the data of a city
+    """
+    usage = memory_usage(df).apply(lambda column: column.map(lambda count: f'{int(count):,}'))
+
+    with pd.option_context(*b_c.PD_OPTIONS):
+        print(usage, '\n')
+
+def check_ingest(city='chicago', rows=2000):
+    """
+    Checks that ingested files survive the csv file of a city being extended
+    and then changed, on a copy of the first rows of the city in a scratch
+    directory.
+    Args:
+        (str) city - name of the city to copy
+        (int) rows - how many rows of the city to copy
+    Returns:
+        (list) a description of each check which failed
+    """
+    import shutil
+    import tempfile
+
+    path = tempfile.mkdtemp()
+    city_data, cache_dir = b_c.CITY_DATA, b_c.CACHE_DIR
+    failures = []
+    try:
+        raw = pd.read_csv(city_data[city], nrows=2 * rows)
+        main_file, new_file = os.path.join(path, 'city.csv'), os.path.join(path, 'new.csv')
+        b_c.CITY_DATA = dict(city_data, **{ city: main_file })
+        b_c.CACHE_DIR = os.path.join(path, 'cache')
+        clear_frames()
+
+        raw.head(rows).to_csv(main_file, index=False)
+        read_data(city)
+
+        # Ingest a year of new trips, then extend the csv file of the city
+        #
+        later = raw.head(rows // 2).copy()
+        for field_name in [ 'Start Time', 'End Time' ]:
+            later[field_name] = later[field_name].str.replace(r'^\d{4}', '2099', regex=True)
+        later.to_csv(new_file, index=False)
+        ingest(city, new_file)
+        raw.to_csv(main_file, index=False)
+        clear_frames()
+        read_data(city)
+
+        # Change the csv file of the city, so the cache is built again
+        #
+        raw.iloc[1:].to_csv(main_file, index=False)
+        clear_frames()
+        df = read_data(city)
+
+        if len(df.index) != len(raw.index) - 1 + len(later.index):
+            failures.append(f'{len(df.index):,} rows rather than {len(raw.index) - 1 + len(later.index):,}')
+        if 2099 not in b_ca.cached_years(city):
+            failures.append('the ingested year was lost')
+        if [ source['path'] for source in b_ca.read_manifest(city)['sources'] ] != [ os.path.abspath(main_file),
+                                                                                     os.path.abspath(new_file) ]:
+            failures.append('the sources are not the csv file of the city and the ingested file')
+    finally:
+        b_c.CITY_DATA, b_c.CACHE_DIR = city_data, cache_dir
+        clear_frames()
+        shutil.rmtree(path, ignore_errors=True)
+
+    return failures
+
 def main():
 
+    print("Testing: ingest")
+    failures = check_ingest()
+    print('ingested files are kept' if not failures else failures)
+
     #city, month, day = get_filters()
     print("Testing: load_data")
     df = load_data('chicago', 'all', 'all')
 
+    print("Testing: show_memory_usage")
+    show_memory_usage(df)
+
     print("Testing: show_data")
     show_data(df, 'chicago', 'all', 'all', row=0, increment=5)
 
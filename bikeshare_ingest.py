@@ -0,0 +1,22 @@
+import sys
+
+import bikeshare_constants as b_c
+import bikeshare_data as b_d
+
+# Adds new trip data, such as the csv file of a new month, to the cache of a city
+#
+#     python bikeshare_ingest.py chicago chicago_2017_07.csv
+#
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in b_c.CITY_DATA:
+        print('\n', '\tusage: python bikeshare_ingest.py <city> <csv file> ...',
+              '\n\n', '\tcities:', ', '.join(b_c.CITY_DATA))
+        sys.exit()
+
+    city = sys.argv[1]
+    for file_name in sys.argv[2:]:
+        rows = b_d.ingest(city, file_name)
+        print(f'{file_name}: {rows:,} new records added for the city: {city}')
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ import bikeshare_inputs as b_i
 import bikeshare_constants as b_c
 import bikeshare_stats as b_s
 import bikeshare_data as b_d
+import bikeshare_cache as b_ca
 
 def get_action():
     """
@@ -79,16 +80,26 @@ def get_city():
 
     return city.lower()
 
-def get_month():
+def get_month(city, year='all'):
     """
-    Asks user to specify a month to analyze.
+    Asks user to specify a month to analyze, from the months the data of the city holds.
+    Args:
+        (str) city - name of the city to analyze
+        (str) year - the year filter, so that only its months are offered
 
     Returns:
         (str) month - name of the month to filter by, or "all" to apply no month filter
     """
+    # Offer every month when the cache cannot tell which ones hold trips, e.g.
+    # while it is still being built by the prefetch of the city
+    #
+    months = b_ca.cached_months(city, year)
+    if not months:
+        months = range(1, 13)
+
     months = Bullet(
-            prompt = "\nPlease choose the month (only through june): ",
-            choices = list( b_c.MONTH_NAMES.values() ),
+            prompt = "\nPlease choose the month: ",
+            choices = list( b_c.MONTH_NAMES[str(month)] for month in months ),
             indent = 0,
             align = 5,
             margin = 2,
@@ -133,6 +144,42 @@ def get_day():
 
     return day.lower()
 
+def get_year(city):
+    """
+    Asks user to specify a year to analyze, when the data of the city spans several years.
+    Args:
+        (str) city - name of the city to analyze
+
+    Returns:
+        (str) year - the year to filter by, or "all" to apply no year filter
+    """
+    # The years are not known until the cache has been built by the prefetch
+    # of the city, and then all of them are analyzed rather than waiting
+    #
+    years = b_ca.cached_years(city)
+    if len(years) < 2:
+        return "all"
+
+    years = Bullet(
+            prompt = "\nPlease choose the year: ",
+            choices = ["All"] + list( str(year) for year in years ),
+            indent = 0,
+            align = 5,
+            margin = 2,
+            shift = 1,
+            bullet = "*",
+            pad_right = 5
+            )
+
+    try:
+        year = years.launch()
+
+    except KeyboardInterrupt:
+        print( "{}".format(b_c.KEYBOARD_INTERRUPT_MSG))
+        sys.exit()
+
+    return year.lower()
+
 def get_time_filter():
     """
     Asks user to specify how to filter the data if at all.
@@ -189,12 +236,13 @@ def get_yes_or_no( prompt_str ):
 
 def get_inputs( df, city, month, day, proceed ):
     """
-    Asks user to specify a city, month, and day to analyze.
+    Asks user to specify a city, month, day, and year to analyze.
 
     Returns:
         (str) city - name of the city to analyze
         (str) month - name of the month to filter by, or "all" to apply no month filter
         (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
     """
     b_c.clear_screen() # print a set of characters to clear the screen
 
@@ -205,6 +253,16 @@ def get_inputs( df, city, month, day, proceed ):
     #
     city = get_city()
 
+    # Start loading the city while the filters are chosen
+    #
+    b_d.prefetch(city)
+    cold = b_ca.cached_months(city) == []
+
+    # Get the user's input for the year, if the city has data for more than one,
+    # first so that only the months of that year are offered
+    #
+    year = get_year(city)
+
     # Get the user's time filter and process accordingly
     #
     if month is None and day is None:
@@ -212,10 +270,10 @@ def get_inputs( df, city, month, day, proceed ):
         answer = get_time_filter()
         #
         if answer == "Filter by both day and month":
-            month = get_month()
+            month = get_month(city, year)
             day = get_day()
         elif answer == "Filter by month":
-            month = get_month()
+            month = get_month(city, year)
             day = "all"
         elif answer == "Filter by day":
             month = "all"
@@ -224,13 +282,23 @@ def get_inputs( df, city, month, day, proceed ):
             month = "all"
             day = "all"
 
+    # The months offered before the cache was built may hold no trips, so
+    # check the choice once the prefetch has finished
+    #
+    if cold and month not in (None, "all"):
+        b_d.wait_prefetch(city)
+        months = b_ca.cached_months(city, year)
+        if months and month not in ( b_c.MONTH_NAMES[str(number)].lower() for number in months ):
+            print( '\nThere are no trips in {} for {}.'.format(month.title(), city.title()) )
+            month = get_month(city, year)
+
     print( '\nInput complete.\n\nNow data is being loaded ...\n' )
 
     proceed = True
 
-    return city, month, day, proceed
+    return city, month, day, year, proceed
 
-def show_inputs( df,  city, month, day ):
+def show_inputs( df,  city, month, day, year='all' ):
     """
     Loads data for the specified city and filters by month and day if applicable.
     Args:
@@ -238,11 +306,12 @@ def show_inputs( df,  city, month, day ):
         (str) city - name of the city to analyze
         (str) month - name of the month to filter by, or "all" to apply no month filter
         (str) day - name of the day of week to filter by, or "all" to apply no day filter
+        (str) year - the year to filter by, or "all" to apply no year filter
 
     """
     # Make variables to store the inputs and the summary
     #
-    inputs = [{'City': city.title(), 'Month': month.title(), 'Day of Week': day}]
+    inputs = [{'City': city.title(), 'Year': year.title(), 'Month': month.title(), 'Day of Week': day}]
     summary = pd.DataFrame( inputs, index = ['Your inputs:']) 
 
     # Count and store the number of records in the dataframe
@@ -274,17 +343,20 @@ def main():
     get_time_filter()
         
     print("\nTesting: get_month") 
-    get_month()
+    get_month('chicago')
         
     print("\nTesting: get_day") 
     get_day()
 
+    print("\nTesting: get_year")
+    get_year('chicago')
+
     print("\nTesting: get_inputs")
     df, city, month, day, proceed = None, None, None, None, True
-    city, month, day, proceed = get_inputs( df, city, month, day, proceed )
+    city, month, day, year, proceed = get_inputs( df, city, month, day, proceed )
     
     print("\nTesting: show_inputs")
-    show_inputs( df,  city, month, day )
+    show_inputs( df,  city, month, day, year )
 
     print("\nTesting: get_yes_or_no")
     get_yes_or_no( "Testing complete?")
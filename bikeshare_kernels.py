@@ -0,0 +1,410 @@
+import sys
+
+from collections import namedtuple
+
+# The following tests if the pandas and numpy libraries have been loaded
+#
+try:
+    import pandas as pd
+except ImportError as error:
+    print('\n', '\tpandas has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+import bikeshare_agg as b_agg
+import bikeshare_stations as b_st
+import bikeshare_sketches as b_sk
+
+# The statistics of a small integer field such as Hour, Month or Year of Birth:
+# its mode, how often the mode occurs, its smallest and largest value, the
+# count of every value from the smallest one up, and the (value, count) of
+# the leading values, the mode first
+#
+IntStats = namedtuple('IntStats', ['mode', 'count', 'min', 'max', 'histogram', 'top'])
+
+# The start and end times of the trips, each sorted on its own, as int64
+# nanoseconds. The number of trips in progress at a time is then the
+# number of starts up to it less the number of ends up to it.
+#
+Sweep = namedtuple('Sweep', ['starts', 'ends'])
+
+# The most trips in progress at once in a group, and the first time it was reached
+#
+Peak = namedtuple('Peak', ['value', 'time'])
+
+
+def int_codes(values):
+    """
+    Shifts the values of an integer field so that the smallest one is 0.
+    Args:
+        (series) values - the values, which may be a nullable integer type
+    Returns:
+        (array) the shifted values, -1 where missing
+        (int) the value which was shifted to 0
+        (int) how many different shifted values there can be
+    """
+    missing = values.isna().to_numpy()
+    data = values.to_numpy(dtype=np.int64, na_value=0)
+    if missing.all():
+        return np.full(len(data), -1, dtype=np.int64), 0, 1
+
+    first = int(data[~missing].min())
+    codes = data - first
+    codes[missing] = -1
+
+    return codes, first, int(codes.max()) + 1
+
+def grouped_histograms(groups, n_groups, codes, size, weights=None):
+    """
+    Counts every code of every group with a single 2-D bincount.
+    Args:
+        (array) groups - the group code of each row
+        (int) n_groups - how many groups there are
+        (array) codes - the code of each row, -1 where missing
+        (int) size - how many different codes there can be
+        (array) weights - how many trips each row stands for, if not one
+    Returns:
+        (array) the count of each code, one row per group
+    """
+    valid = codes >= 0
+    keys = groups[valid].astype(np.int64) * size + codes[valid]
+    if weights is not None:
+        weights = weights[valid]
+
+    histograms = np.bincount(keys, weights=weights, minlength=n_groups * size)
+
+    return histograms.astype(np.int64).reshape(n_groups, size)
+
+def histogram_stats(histogram, first=0, top_n=1):
+    """
+    Reads the mode, top count, min, max and leading values off a histogram.
+
+    Ties go to the smallest value, as they do with pandas mode.
+    Args:
+        (array) histogram - the count of each code
+        (int) first - the value of code 0
+        (int) top_n - how many leading values to find
+    Returns:
+        (IntStats) the statistics, or None if the histogram is empty
+    """
+    present = np.flatnonzero(histogram)
+    if not len(present):
+        return None
+
+    top = tuple( (first + int(ix), int(histogram[ix])) for ix in b_agg.top_positions(histogram, top_n) )
+
+    return IntStats(top[0][0], top[0][1], first + int(present[0]), first + int(present[-1]), histogram, top)
+
+def int_stats(values, top_n=1):
+    """
+    Finds the statistics of an integer field in one bincount pass.
+    Args:
+        (series) values - the values, which may be a nullable integer type
+        (int) top_n - how many leading values to find
+    Returns:
+        (IntStats) the statistics, or None if every value is missing
+    """
+    codes, first, size = int_codes(values)
+
+    return histogram_stats(np.bincount(codes[codes >= 0], minlength=size), first, top_n)
+
+def int_stats_by(df, group_field, field_name, top_n=1):
+    """
+    Finds the statistics of an integer field for every group in one 2-D bincount pass.
+    Args:
+        (dataframe) df - the data set
+        (str) group_field - the column to group by, or None for a single group
+        (str) field_name - the integer field, e.g. 'Hour'
+        (int) top_n - how many leading values to find
+    Returns:
+        (dict) the IntStats of each group label which has any values, in display order
+    """
+    groups, labels = b_agg.group_codes(df, group_field)
+    codes, first, size = int_codes(df[field_name])
+    histograms = grouped_histograms(groups, len(labels), codes, size)
+
+    results = {}
+    for label, histogram in zip(labels, histograms):
+        stats = histogram_stats(histogram, first, top_n)
+        if stats is not None:
+            results[label] = stats
+
+    return results
+
+def sorted_percentiles(groups, n_groups, values, percentiles):
+    """
+    Finds exact percentiles of every group from a single sort of the rows by
+    group and value, interpolating between the two nearest values as numpy
+    and pandas do.
+    Args:
+        (array) groups - the group code of each row
+        (int) n_groups - how many groups there are
+        (array) values - the value of each row, NaN where missing
+        (list) percentiles - the percentiles to find, from 0 to 100
+    Returns:
+        (array) the percentiles, one row per group, NaN for a group with no values
+    """
+    valid = ~np.isnan(values)
+    groups = groups[valid].astype(np.int64)
+    values = values[valid]
+    values = values[np.lexsort((values, groups))]
+
+    # Each group is now a run of sorted values; find where each percentile
+    # falls within its group's run
+    #
+    sizes = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(sizes) - sizes
+    positions = (sizes[:, None] - 1) * (np.asarray(percentiles, dtype=np.float64) / 100)[None, :]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+
+    if not len(values):
+        return np.full(positions.shape, np.nan)
+
+    last = len(values) - 1
+    low = values[(starts[:, None] + lower).clip(0, last)]
+    high = values[(starts[:, None] + upper).clip(0, last)]
+    found = low + (high - low) * (positions - lower)
+    found[sizes == 0] = np.nan
+
+    return found
+
+def percentiles_by(df, group_field, field_name, percentiles, approximate=False, resolution=32):
+    """
+    Finds percentiles of a numeric field for every group, exactly from one
+    sort, or estimated from mergeable log histograms.
+    Args:
+        (dataframe) df - the data set
+        (str) group_field - the column to group by, or None for a single group
+        (str) field_name - the numeric field, e.g. 'Trip Duration'
+        (list) percentiles - the percentiles to find, from 0 to 100
+        (boolean) approximate - estimate the percentiles from log histograms
+        (int) resolution - how many histogram buckets there are per doubling
+    Returns:
+        (dict) the array of percentiles of each group label, NaN for a group with no values
+    """
+    groups, labels = b_agg.group_codes(df, group_field)
+    values = df[field_name].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    if approximate:
+        found = [ b_sk.log_percentiles(histogram, percentiles)
+                  for histogram in b_sk.log_histograms_by(groups, len(labels), values, resolution) ]
+    else:
+        found = sorted_percentiles(groups, len(labels), values, percentiles)
+
+    return dict(zip(labels, found))
+
+def sweep(df):
+    """
+    Sorts the start and end events of the trips which have both times.
+    A trip recorded as ending before it starts is taken to end as it starts.
+    Args:
+        (dataframe) df - the data set, with Start Time and End Time
+    Returns:
+        (Sweep) the sorted events
+    """
+    starts = df['Start Time'].to_numpy(dtype='datetime64[ns]')
+    ends = df['End Time'].to_numpy(dtype='datetime64[ns]')
+    valid = ~(np.isnat(starts) | np.isnat(ends))
+
+    starts = starts[valid].view(np.int64)
+    ends = np.maximum(ends[valid].view(np.int64), starts)
+
+    return Sweep(np.sort(starts), np.sort(ends))
+
+def in_use(events, times):
+    """
+    Counts the trips in progress at each of some times, a trip ending at a
+    time no longer counting, so that a bike returned and taken again at
+    once is only counted once.
+    Args:
+        (Sweep) events - the sorted events
+        (array) times - the times, as int64 nanoseconds
+    Returns:
+        (array) the number of trips in progress at each time
+    """
+    return (np.searchsorted(events.starts, times, side='right')
+            - np.searchsorted(events.ends, times, side='right'))
+
+def peaks_by(groups, labels, times, levels):
+    """
+    Finds the highest level of every group, and the first time it was reached.
+    Args:
+        (array) groups - the group code of each time
+        (list) labels - the label of each group code
+        (array) times - the times, as int64 nanoseconds
+        (array) levels - the number of trips in progress at each time
+    Returns:
+        (dict) the Peak of each group label which has any times
+    """
+    if not len(levels):
+        return {}
+
+    # Sort each group from its highest level, ties going to the earliest time
+    #
+    order = np.lexsort((times, -levels, groups))
+    firsts = order[b_agg.segment_starts(groups[order])]
+
+    return { labels[groups[first]]: Peak(int(levels[first]), int(times[first])) for first in firsts }
+
+def concurrency_by(df, events, group_field):
+    """
+    Finds the peak number of trips in progress for every group of trip
+    starts, from one sorted sweep of the events. The number of trips in
+    progress only rises when a trip starts, so its peak is always at a start.
+    Args:
+        (dataframe) df - the data set, with Start Time
+        (Sweep) events - the sorted events of the data set
+        (str) group_field - the column to group by, or None for a single group
+    Returns:
+        (dict) the Peak of each group label which has any trips, empty when
+               no trip has both a start and an end time
+    """
+    if not len(events.starts):
+        return {}
+
+    groups, labels = b_agg.group_codes(df, group_field)
+    times = df['Start Time'].to_numpy(dtype='datetime64[ns]')
+    valid = ~np.isnat(times)
+    times = times[valid].view(np.int64)
+
+    return peaks_by(np.asarray(groups)[valid], labels, times, in_use(events, times))
+
+def hourly_peaks(events):
+    """
+    Finds the peak number of trips in progress in each hour of the day,
+    from the starts within the hour and the trips already in progress as
+    each hour begins.
+    Args:
+        (Sweep) events - the sorted events
+    Returns:
+        (array) the peak of each hour from 0 to 23
+    """
+    peaks = np.zeros(24, dtype=np.int64)
+    if not len(events.starts):
+        return peaks
+
+    hour = np.int64(3600 * 10**9)
+    boundaries = np.arange(events.starts[0] // hour * hour + hour, events.ends[-1], hour)
+    times = np.concatenate([ events.starts, boundaries ])
+    np.maximum.at(peaks, times // hour % 24, in_use(events, times))
+
+    return peaks
+
+def in_use_curve(events, points):
+    """
+    Finds the step curve of the number of trips in progress, its level
+    after every start and end. A curve of more than so many steps is cut
+    into that many equal spans of time and only the highest step of each
+    span is kept, so that the peaks survive the downsampling.
+    Args:
+        (Sweep) events - the sorted events
+        (int) points - the most steps to keep
+    Returns:
+        (array) the time of each step, as int64 nanoseconds
+        (array) the number of trips in progress from that time
+    """
+    times = np.unique(np.concatenate([ events.starts, events.ends ]))
+    levels = in_use(events, times)
+    if len(times) <= points:
+        return times, levels
+
+    spans = np.minimum(((times - times[0]) / (times[-1] - times[0]) * points).astype(np.int64), points - 1)
+    peaks = peaks_by(spans, list(range(points)), times, levels)
+    kept = np.array([ (peak.time, peak.value) for peak in peaks.values() ], dtype=np.int64)
+    kept = kept[np.argsort(kept[:, 0], kind='stable')]
+
+    return kept[:, 0], kept[:, 1]
+
+def week_slots(times):
+    """
+    Finds the hour of the week of each time, Sunday 12 AM being 0, without
+    going through the pandas date accessors.
+    Args:
+        (series) times - the times
+    Returns:
+        (array) the weekday * 24 + hour of each time, -1 where missing
+    """
+    times = times.to_numpy(dtype='datetime64[ns]')
+    missing = np.isnat(times)
+    hours = times.view(np.int64) // (3600 * 10**9)
+
+    # 1 January 1970 was a Thursday, the fifth day of a week starting on Sunday
+    #
+    slots = (hours + 4 * 24) % (7 * 24)
+    slots[missing] = -1
+
+    return slots
+
+def station_flows(df):
+    """
+    Counts the departures and arrivals of every station in every hour of
+    the week, with one bincount each over the station ids.
+    Args:
+        (dataframe) df - the data set, with Start Time and End Time
+    Returns:
+        (array) the departures, shaped (stations, 7 days, 24 hours)
+        (array) the arrivals, shaped the same way
+    """
+    n_stations = len(b_st.station_names(df))
+    size = 7 * 24
+
+    def flows(field_name, time_field):
+        codes = df[field_name].cat.codes.to_numpy().astype(np.int64)
+        slots = week_slots(df[time_field])
+        valid = (codes >= 0) & (slots >= 0)
+        counts = np.bincount(codes[valid] * size + slots[valid], minlength=n_stations * size)
+        return counts.reshape(n_stations, 7, 24)
+
+    return flows('Start Station', 'Start Time'), flows('End Station', 'End Time')
+
+def hour_heatmap(df, row_field, split_field=None):
+    """
+    Counts the trips starting in every hour of every row, e.g. of every day
+    of the week, in one 2-D bincount pass, optionally split by another
+    field such as User Type.
+    Args:
+        (dataframe) df - the data set, with Hour
+        (str) row_field - the column of the rows, e.g. 'Day of Week' or 'Month'
+        (str) split_field - the column to split by, or None for a single split
+    Returns:
+        (array) the counts, shaped (splits, rows, 24 hours)
+        (list) the label of each row
+        (list) the label of each split
+    """
+    rows, row_labels = b_agg.group_codes(df, row_field)
+    splits, split_labels = b_agg.group_codes(df, split_field)
+    rows = np.asarray(rows).astype(np.int64)
+    splits = np.asarray(splits).astype(np.int64)
+
+    # Rows without a split or row value, e.g. without a user type, count in none
+    #
+    hours = np.where((rows >= 0) & (splits >= 0), df['Hour'].to_numpy().astype(np.int64), -1)
+    counts = grouped_histograms(splits * len(row_labels) + rows, len(split_labels) * len(row_labels), hours, 24)
+
+    return counts.reshape(len(split_labels), len(row_labels), 24), row_labels, split_labels
+
+
+def main():
+
+    import bikeshare_data as b_d
+
+    print("Testing: int_stats_by")
+    df = b_d.require(b_d.read_data('chicago'), 'Hour', 'Year of Birth')
+    for group_field in [ None, 'Month', 'Day of Week' ]:
+        for label, stats in int_stats_by(df, group_field, 'Hour').items():
+            print(label, stats.mode, stats.count, stats.min, stats.max)
+    print(int_stats(df['Year of Birth'])[:4])
+
+    print("Testing: percentiles_by")
+    for approximate in [ False, True ]:
+        for label, found in percentiles_by(df, 'Month', 'Trip Duration', [ 50, 90, 95, 99 ], approximate).items():
+            print(label, found.round(1))
+    print(df.groupby('Month')['Trip Duration'].quantile([ .5, .9, .95, .99 ]).unstack().round(1))
+
+if __name__ == "__main__":
+    main()
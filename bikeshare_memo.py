@@ -0,0 +1,288 @@
+import os
+import json
+import hashlib
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bikeshare_constants as b_c
+import bikeshare_cache as b_ca
+import bikeshare_data as b_d
+import bikeshare_cube as b_cube
+import bikeshare_results as b_r
+
+# The statistics which can be kept, by name
+#
+COMPUTE = { 'time': b_r.compute_time_stats,
+            'station': b_r.compute_station_stats,
+            'trip duration': b_r.compute_trip_duration_stats,
+            'user': b_r.compute_user_stats,
+            'bikes in use': b_r.compute_concurrency_stats,
+            'station flow': b_r.compute_flow_stats,
+            'routes': b_r.compute_route_stats,
+            'demand by hour': b_r.compute_heatmap_stats }
+
+# The statistics which can be counted from the cube of the city
+#
+CUBE_STATISTICS = [ 'time', 'station', 'trip duration', 'user' ]
+
+# The results computed or read in this session, least recently used first
+#
+RESULTS = OrderedDict()
+
+# How often a result was found in memory, found on disk, or computed
+#
+COUNTS = { 'memory hits': 0, 'disk hits': 0, 'misses': 0 }
+
+# Guards RESULTS and COUNTS, which the background workers also use
+#
+LOCK = threading.Lock()
+
+# The statistics being computed in the background: the inputs they are for,
+# the pool computing them and the future of each statistic
+#
+BACKGROUND = { 'inputs': None, 'executor': None, 'futures': {} }
+
+
+def result_key(city, month, day, year, statistic, stamp):
+    """
+    Identifies a result by its inputs, the data it was computed from, the
+    settings which change how the statistics are found, and the version of
+    the format results are kept in.
+    Args:
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+        (str) statistic - the name of the statistic, a key of COMPUTE
+        (str) stamp - the stamp of the city's data
+    Returns:
+        (str) the key
+    """
+    settings = [ b_c.APPROXIMATE_STATIONS, b_c.TOPK_SIZE, b_c.APPROXIMATE_PRECISION, b_c.DISTINCT_PRECISION,
+                 b_c.DURATION_PERCENTILES, b_c.APPROXIMATE_DURATIONS, b_c.DURATION_RESOLUTION, b_c.TOP_N,
+                 b_c.HEATMAP_BY_USER_TYPE, b_c.CONCURRENCY_CURVE_POINTS ]
+
+    return json.dumps([ b_c.RESULTS_VERSION, city, month, day, str(year), statistic, stamp, settings ])
+
+def result_path(city, key):
+    """
+    Returns the file in which a result is kept on disk, inside the city's cache.
+    Args:
+        (str) city - name of the city
+        (str) key - the key of the result
+    """
+    name = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+    return os.path.join(b_ca.cache_path(city), 'results', name + '.json')
+
+def read_result(city, key):
+    """
+    Reads a result kept on disk.
+    Args:
+        (str) city - name of the city
+        (str) key - the key of the result
+    Returns:
+        the result, or None if it is not kept or cannot be read
+    """
+    try:
+        with open(result_path(city, key)) as result_file:
+            kept = json.load(result_file)
+        if kept.get('key') != key:
+            return None
+        return b_r.from_json(kept['result'])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+def write_result(city, key, result):
+    """
+    Keeps a result on disk, replacing any older file in a single step.
+    Args:
+        (str) city - name of the city
+        (str) key - the key of the result
+        result - the result to keep
+    """
+    path = result_path(city, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as result_file:
+            json.dump({ 'key': key, 'result': b_r.to_json(result) }, result_file)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
+
+def keep_result(key, result):
+    """
+    Keeps a result in memory, dropping the least recently used ones
+    beyond RESULT_CACHE_SIZE.
+    """
+    with LOCK:
+        RESULTS[key] = result
+        RESULTS.move_to_end(key)
+        while len(RESULTS) > b_c.RESULT_CACHE_SIZE:
+            RESULTS.popitem(last=False)
+
+def count(name):
+    """
+    Adds one to a hit or miss counter.
+    """
+    with LOCK:
+        COUNTS[name] += 1
+
+def compute(df, city, month, day, year, statistic):
+    """
+    Computes a statistic of the filtered data, from the cube of the city
+    when it counts the same data, otherwise from the rows.
+    Args:
+        (dataframe) df - the filtered data
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+        (str) statistic - the name of the statistic, a key of COMPUTE
+    Returns:
+        the result
+    """
+    if statistic in CUBE_STATISTICS:
+        return COMPUTE[statistic](df, month, day, cube=b_cube.selected_cube(df, city, month, day, year))
+
+    return COMPUTE[statistic](df, month, day)
+
+def get_result(df, city, month, day, year, statistic):
+    """
+    Returns a statistic of the filtered data, from memory, from disk, or
+    computing it when it is not kept for the data df was read from.
+    Args:
+        (dataframe) df - the filtered data
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+        (str) statistic - the name of the statistic, a key of COMPUTE
+    Returns:
+        the result
+    """
+    # The stamp is the one the frame was read with, not the one of the
+    # cache now, which another run may have updated since
+    #
+    stamp = df.attrs.get('stamp')
+
+    # Without a cache there is no stamp to tell whether a result is current
+    #
+    if stamp is None:
+        count('misses')
+        return COMPUTE[statistic](df, month, day)
+
+    key = result_key(city, month, day, year, statistic, stamp)
+
+    with LOCK:
+        result = RESULTS.get(key)
+        if result is not None:
+            COUNTS['memory hits'] += 1
+            RESULTS.move_to_end(key)
+    if result is not None:
+        return result
+
+    result = read_result(city, key)
+    if result is not None:
+        count('disk hits')
+    else:
+        count('misses')
+        result = compute(df, city, month, day, year, statistic)
+        write_result(city, key, result)
+
+    keep_result(key, result)
+
+    return result
+
+def precompute(df, city, month, day, year):
+    """
+    Starts computing every statistic of the filtered data in a pool of
+    workers, cancelling any work still left for earlier inputs.
+    Args:
+        (dataframe) df - the filtered data
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    cancel_precompute()
+
+    # There is nothing to compute when no trips pass the filters
+    #
+    if df.empty:
+        return
+
+    # Derive the lazy columns before the workers share the data,
+    # so that none of them adds a column while another reads it
+    #
+    b_d.require(df, 'Hour')
+    if 'Birth Year' in df:
+        b_d.require(df, 'Year of Birth')
+
+    executor = ThreadPoolExecutor(max_workers=b_c.PRECOMPUTE_WORKERS)
+    BACKGROUND['inputs'] = (id(df), city, month, day, year)
+    BACKGROUND['executor'] = executor
+    BACKGROUND['futures'] = { statistic: executor.submit(get_result, df, city, month, day, year, statistic)
+                              for statistic in COMPUTE }
+
+def result(df, city, month, day, year, statistic):
+    """
+    Returns a statistic of the filtered data, waiting for the background
+    workers if they are computing it, otherwise like get_result.
+    Args:
+        (dataframe) df - the filtered data
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+        (str) statistic - the name of the statistic, a key of COMPUTE
+    Returns:
+        the result
+    """
+    future = BACKGROUND['futures'].get(statistic)
+    if BACKGROUND['inputs'] == (id(df), city, month, day, year) and future is not None and not future.cancelled():
+        return future.result()
+
+    return get_result(df, city, month, day, year, statistic)
+
+def cancel_precompute():
+    """
+    Cancels the background work which has not started. Work already running
+    cannot be stopped part way; it finishes in the background and its
+    results are only kept in the results cache.
+    """
+    for future in BACKGROUND['futures'].values():
+        future.cancel()
+    if BACKGROUND['executor'] is not None:
+        BACKGROUND['executor'].shutdown(wait=False)
+
+    BACKGROUND.update(inputs=None, executor=None, futures={})
+
+def cache_stats():
+    """
+    Describes how often results were reused.
+    Returns:
+        (str) the hit and miss counts
+    """
+    hits = COUNTS['memory hits'] + COUNTS['disk hits']
+
+    return (f"Results cache: {hits:,} hits ({COUNTS['memory hits']:,} memory, "
+            f"{COUNTS['disk hits']:,} disk), {COUNTS['misses']:,} misses")
+
+
+def main():
+
+    import bikeshare_data as b_d
+
+    print("Testing: get_result")
+    df = b_d.read_data('chicago')
+    for repeat in range(2):
+        for statistic in COMPUTE:
+            get_result(df, 'chicago', 'all', 'all', 'all', statistic)
+        RESULTS.clear()
+        print(cache_stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,629 @@
+import sys
+import json
+
+from dataclasses import dataclass, asdict, fields, is_dataclass
+from typing import Dict, Optional, Union, get_args, get_origin, get_type_hints
+
+# The following tests if the pandas and numpy libraries have been loaded
+#
+try:
+    import pandas as pd
+except ImportError as error:
+    print('\n', '\tpandas has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+import bikeshare_constants as b_c
+import bikeshare_data as b_d
+import bikeshare_agg as b_agg
+import bikeshare_kernels as b_k
+import bikeshare_stations as b_st
+import bikeshare_routes as b_ro
+import bikeshare_cube as b_cube
+
+# The results of the analyses. They hold no data frames, only the
+# numbers shown, so they can be kept, timed, computed in another process
+# and saved as JSON. Groups are keyed by their display name, e.g. 'June'
+# or 'Monday', and are None when the selection is a single month or day.
+#
+
+@dataclass
+class Mode:
+    """The most common value of a field, how often it occurs, and the count of each leading value, most first."""
+    value: int
+    count: int
+    top: Dict[str, int]
+
+@dataclass
+class StationField:
+    """The mode of a station field, its count, how many different values there are, and the leading values."""
+    mode: str
+    count: int
+    range: int
+    top: Dict[str, int]
+
+@dataclass
+class Duration:
+    """The total, mean and percentiles of the trip duration in seconds, the percentiles keyed e.g. '95%'."""
+    total: float
+    mean: float
+    percentiles: Dict[str, float]
+
+@dataclass
+class Shares:
+    """The count and percentage of trips of each value, largest first."""
+    counts: Dict[str, int]
+    percentages: Dict[str, float]
+
+@dataclass
+class BirthYears:
+    """The latest, earliest and most common birth year of the riders, and the leading birth years."""
+    max: int
+    min: int
+    mode: int
+    top: Dict[str, int]
+
+@dataclass
+class Peak:
+    """The most trips in progress at once, and the first time it was reached, in ISO format."""
+    value: int
+    time: str
+
+@dataclass
+class TimeStats:
+    records: int
+    overall: Mode
+    by_month: Optional[Dict[str, Mode]]
+    by_day: Optional[Dict[str, Mode]]
+
+@dataclass
+class StationStats:
+    records: int
+    overall: Dict[str, StationField]
+    by_month: Optional[Dict[str, Dict[str, StationField]]]
+    by_day: Optional[Dict[str, Dict[str, StationField]]]
+
+@dataclass
+class DurationStats:
+    records: int
+    overall: Duration
+    by_month: Optional[Dict[str, Duration]]
+    by_day: Optional[Dict[str, Duration]]
+
+@dataclass
+class ShareStats:
+    overall: Shares
+    by_month: Optional[Dict[str, Shares]]
+    by_day: Optional[Dict[str, Shares]]
+
+@dataclass
+class BirthYearStats:
+    overall: BirthYears
+    by_month: Optional[Dict[str, BirthYears]]
+    by_day: Optional[Dict[str, BirthYears]]
+
+@dataclass
+class UserStats:
+    records: int
+    user_types: ShareStats
+    genders: Optional[ShareStats]
+    birth_years: Optional[BirthYearStats]
+
+@dataclass
+class ConcurrencyStats:
+    records: int
+    overall: Optional[Peak]
+    by_hour: Dict[str, int]
+    by_month: Optional[Dict[str, Peak]]
+    by_day: Optional[Dict[str, Peak]]
+    curve: Dict[str, int]
+
+@dataclass
+class StationFlow:
+    """
+    The departures and arrivals of a station, its net outflow, the hour of
+    the week in which it loses (or gains) the most bikes with the net
+    outflow then, and its net outflow by hour of the day.
+    """
+    departures: int
+    arrivals: int
+    net: int
+    peak_day: str
+    peak_hour: int
+    peak_net: int
+    by_hour: Dict[str, int]
+
+@dataclass
+class FlowStats:
+    records: int
+    outflow: Dict[str, StationFlow]
+    inflow: Dict[str, StationFlow]
+
+@dataclass
+class Routes:
+    """
+    The most common routes and their trip counts, keyed 'Start->End', the
+    number of trips with both stations known, and the percentage of them
+    ending where they started.
+    """
+    top: Dict[str, int]
+    trips: int
+    round_trips: float
+
+@dataclass
+class RouteStats:
+    records: int
+    overall: Routes
+    destinations: Dict[str, Dict[str, int]]
+    by_month: Optional[Dict[str, Routes]]
+    by_day: Optional[Dict[str, Routes]]
+
+@dataclass
+class Heatmap:
+    """
+    The trips starting in each hour of each day of the week and of each
+    month, the days and months keyed by name and the hours '0' to '23'.
+    """
+    by_day: Dict[str, Dict[str, int]]
+    by_month: Dict[str, Dict[str, int]]
+
+@dataclass
+class HeatmapStats:
+    records: int
+    overall: Heatmap
+    by_user_type: Optional[Dict[str, Heatmap]]
+
+# The result types, by name, for reading results back from JSON
+#
+RESULT_TYPES = { result_type.__name__: result_type
+                 for result_type in [ TimeStats, StationStats, DurationStats, UserStats, ConcurrencyStats,
+                                      FlowStats, RouteStats, HeatmapStats ] }
+
+
+def month_name(m):
+    """
+    Returns the display name of a month number.
+    """
+    return b_c.MONTH_NAMES[str(m)]
+
+def leaders(top):
+    """
+    Keys the (value, count) of the leading values by value, most first.
+    """
+    return { str(value): count for value, count in top }
+
+def compute_time_stats(df, month, day, top_n=None, cube=None):
+    """
+    Finds the most common trip start hours, overall and by month and day.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+        (int) top_n - how many leading hours to find, TOP_N if not given
+        (dict) cube - the cube cells of the same selection, to count the hours
+                      from instead of the rows
+    Returns:
+        (TimeStats) the results
+    """
+    top_n = top_n or b_c.TOP_N
+
+    def mode(hours):
+        return Mode(hours.mode, hours.count, leaders(hours.top))
+
+    if cube is not None:
+        def hours_by(group_field):
+            return b_cube.int_stats_by(cube, 'Hour', group_field, top_n)
+    else:
+        # Derive the trip start hour if it has not been yet
+        #
+        b_d.require(df, 'Hour')
+
+        def hours_by(group_field):
+            return b_k.int_stats_by(df, group_field, 'Hour', top_n)
+
+    by_month = by_day = None
+    if month == 'all':
+        by_month = { month_name(m): mode(hours) for m, hours in hours_by('Month').items() }
+    if day == 'all':
+        by_day = { d: mode(hours) for d, hours in hours_by('Day of Week').items() }
+
+    return TimeStats(len(df.index), mode(hours_by(None)['All']), by_month, by_day)
+
+def compute_station_stats(df, month, day, top_n=None, cube=None):
+    """
+    Finds the most popular start stations, end stations and trips, overall
+    and by month and day, with how many different ones there are.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+        (int) top_n - how many leading values of each field to find, TOP_N if not given
+        (dict) cube - the cube cells of the same selection, to count the
+                      stations from instead of the rows; the cube is exact,
+                      so it is not used when the statistics are to be estimated
+    Returns:
+        (StationStats) the results
+    """
+    top_n = top_n or b_c.TOP_N
+
+    def station_fields(field_stats):
+        return { field_name: StationField(field.mode, field.count, field.range, leaders(field.top))
+                 for field_name, field in field_stats.items() }
+
+    if cube is not None and not b_c.APPROXIMATE_STATIONS and b_c.DISTINCT_PRECISION is None:
+        def stats_by(group_field):
+            return b_cube.field_stats_by(cube, group_field, b_c.STATION_FIELDS, top_n)
+    else:
+        def stats_by(group_field):
+            return b_agg.field_stats_by(df, group_field, b_c.STATION_FIELDS, b_c.APPROXIMATE_STATIONS,
+                                        b_c.DISTINCT_PRECISION, sketches, top_n)
+
+    # Find the statistics by month and by day first, so that estimated
+    # ranges of the whole selection are rolled up from theirs
+    #
+    sketches = {}
+    by_month = by_day = None
+    if month == 'all':
+        by_month = { month_name(m): station_fields(field_stats) for m, field_stats in stats_by('Month').items() }
+    if day == 'all':
+        by_day = { d: station_fields(field_stats) for d, field_stats in stats_by('Day of Week').items() }
+
+    return StationStats(len(df.index), station_fields(stats_by(None)['All']), by_month, by_day)
+
+def compute_trip_duration_stats(df, month, day, cube=None):
+    """
+    Finds the total, mean and percentiles of the trip duration, overall and
+    by month and day.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+        (dict) cube - the cube cells of the same selection, to sum the
+                      durations from instead of the rows; the percentiles
+                      are always found from the rows
+    Returns:
+        (DurationStats) the results
+    """
+    def durations_by(group_field):
+        if cube is not None:
+            return b_cube.duration_by(cube, group_field)
+        if group_field is None:
+            return { 'All': (df['Trip Duration'].sum(), df['Trip Duration'].mean()) }
+        durations = df.groupby(group_field, observed=True)['Trip Duration']
+        totals, means = durations.sum(), durations.mean()
+        return { label: (totals[label], means[label]) for label in totals.index }
+
+    def stats_by(group_field):
+        percentiles = b_k.percentiles_by(df, group_field, 'Trip Duration', b_c.DURATION_PERCENTILES,
+                                         b_c.APPROXIMATE_DURATIONS, b_c.DURATION_RESOLUTION)
+        return { label: Duration(float(total), float(mean),
+                                 { f'{p:g}%': float(value) for p, value in zip(b_c.DURATION_PERCENTILES, percentiles[label])
+                                   if not np.isnan(value) })
+                 for label, (total, mean) in durations_by(group_field).items() }
+
+    by_month = by_day = None
+    if month == 'all':
+        by_month = { month_name(m): duration for m, duration in stats_by('Month').items() }
+    if day == 'all':
+        by_day = stats_by('Day of Week')
+
+    return DurationStats(len(df.index), stats_by(None)['All'], by_month, by_day)
+
+def shares_by(df, field_name, group_field, cube=None):
+    """
+    Counts each value of a rider field and its percentage of the trips for
+    every group, leaving out the values which do not occur.
+    Args:
+        (dataframe) df - the data set
+        (str) field_name - 'User Type' or 'Gender'
+        (str) group_field - the column to group by, or None for a single group
+        (dict) cube - the cube cells of the same selection, to count from instead of the rows
+    Returns:
+        (dict) the Shares of each group label which has any trips, largest first
+    """
+    if cube is not None:
+        breakdown = b_cube.breakdown_by(cube, group_field, field_name)
+    else:
+        breakdown = b_agg.breakdown_by(df, group_field, field_name)
+
+    # Order the values of each group from the largest count, ties in category order
+    #
+    orders = np.argsort(-breakdown.counts, axis=1, kind='stable')
+
+    results = {}
+    for label, counts, percentages, order in zip(breakdown.labels, breakdown.counts, breakdown.percentages, orders):
+        order = order[counts[order] > 0]
+        results[label] = Shares({ breakdown.names[ix]: int(counts[ix]) for ix in order },
+                                { breakdown.names[ix]: float(percentages[ix]) for ix in order })
+
+    return results
+
+def share_stats(df, field_name, month, day, cube=None):
+    """
+    Counts each value of a rider field, overall and by month and day.
+    Args:
+        (dataframe) df - the filtered data
+        (str) field_name - 'User Type' or 'Gender'
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+        (dict) cube - the cube cells of the same selection, to count from instead of the rows
+    Returns:
+        (ShareStats) the results
+    """
+    by_month = by_day = None
+    if month == 'all':
+        by_month = { month_name(m): shares for m, shares in shares_by(df, field_name, 'Month', cube).items() }
+    if day == 'all':
+        by_day = shares_by(df, field_name, 'Day of Week', cube)
+
+    return ShareStats(shares_by(df, field_name, None, cube).get('All', Shares({}, {})), by_month, by_day)
+
+def birth_year_stats(df, month, day, top_n=1, cube=None):
+    """
+    Finds the latest, earliest and most common birth years, overall and by month and day.
+    Args:
+        (dataframe) df - the filtered data, with Birth Year
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+        (int) top_n - how many leading birth years to find
+        (dict) cube - the cube cells of the same selection, to count from instead of the rows
+    Returns:
+        (BirthYearStats) the results, or None if no birth year is known
+    """
+    def birth_years(stats):
+        return BirthYears(stats.max, stats.min, stats.mode, leaders(stats.top))
+
+    if cube is not None:
+        def stats_by(group_field):
+            return b_cube.int_stats_by(cube, 'Birth Year', group_field, top_n)
+    else:
+        # Derive the year of birth if it has not been yet
+        #
+        b_d.require(df, 'Year of Birth')
+
+        def stats_by(group_field):
+            return b_k.int_stats_by(df, group_field, 'Year of Birth', top_n)
+
+    overall = stats_by(None).get('All')
+    if overall is None:
+        return None
+
+    by_month = by_day = None
+    if month == 'all':
+        by_month = { month_name(m): birth_years(stats) for m, stats in stats_by('Month').items() }
+    if day == 'all':
+        by_day = { d: birth_years(stats) for d, stats in stats_by('Day of Week').items() }
+
+    return BirthYearStats(birth_years(overall), by_month, by_day)
+
+def compute_user_stats(df, month, day, top_n=None, cube=None):
+    """
+    Counts the trips by user type and gender and finds the birth years of
+    the riders, overall and by month and day. The gender and birth year
+    are None for a city which does not collect them.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+        (int) top_n - how many leading birth years to find, TOP_N if not given
+        (dict) cube - the cube cells of the same selection, to count from instead of the rows
+    Returns:
+        (UserStats) the results
+    """
+    genders = share_stats(df, 'Gender', month, day, cube) if 'Gender' in df else None
+    birth_years = birth_year_stats(df, month, day, top_n or b_c.TOP_N, cube) if 'Birth Year' in df else None
+
+    return UserStats(len(df.index), share_stats(df, 'User Type', month, day, cube), genders, birth_years)
+
+def compute_concurrency_stats(df, month, day):
+    """
+    Finds the most bikes in use at once, overall, in each hour of the day,
+    and by month and day, from one sorted sweep of the trip start and end
+    times, and the curve of the bikes in use over time, keyed by the time
+    of each step in ISO format and downsampled to CONCURRENCY_CURVE_POINTS steps.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+    Returns:
+        (ConcurrencyStats) the results
+    """
+    events = b_k.sweep(df)
+
+    def peak(found):
+        return Peak(found.value, pd.Timestamp(found.time).isoformat())
+
+    by_month = by_day = None
+    if month == 'all':
+        by_month = { month_name(m): peak(found) for m, found in b_k.concurrency_by(df, events, 'Month').items() }
+    if day == 'all':
+        by_day = { d: peak(found) for d, found in b_k.concurrency_by(df, events, 'Day of Week').items() }
+
+    overall = b_k.concurrency_by(df, events, None).get('All')
+    by_hour = { str(hour): int(found) for hour, found in enumerate(b_k.hourly_peaks(events)) }
+
+    times, levels = b_k.in_use_curve(events, b_c.CONCURRENCY_CURVE_POINTS)
+    curve = { pd.Timestamp(time).isoformat(): int(level) for time, level in zip(times, levels) }
+
+    return ConcurrencyStats(len(df.index), peak(overall) if overall else None, by_hour, by_month, by_day, curve)
+
+def compute_flow_stats(df, month, day):
+    """
+    Finds the stations losing and gaining the most bikes, from the
+    departures and arrivals of every station in every hour of the week.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter
+        (str) day - the day filter
+    Returns:
+        (FlowStats) the results
+    """
+    departures, arrivals = b_k.station_flows(df)
+    net = departures - arrivals
+    totals = net.sum(axis=(1, 2))
+    names = b_st.station_names(df)
+
+    def flow(ix, sign):
+        slots = net[ix].ravel()
+        slot = int((slots * sign).argmax())
+        return StationFlow(int(departures[ix].sum()), int(arrivals[ix].sum()), int(totals[ix]),
+                           b_c.DAY_NAMES[str(slot // 24)], slot % 24, int(slots[slot]),
+                           { str(hour): int(value) for hour, value in enumerate(net[ix].sum(axis=0)) })
+
+    def most(sign):
+        # Ties go to the first station name, the station ids being in name order
+        #
+        order = np.lexsort((np.arange(len(totals)), -sign * totals))
+        order = order[sign * totals[order] > 0][:b_c.FLOW_STATIONS]
+        return { names[ix]: flow(ix, sign) for ix in order }
+
+    return FlowStats(len(df.index), most(1), most(-1))
+
+def compute_route_stats(df, month, day):
+    """
+    Finds the most common routes and the share of round trips, overall and
+    by month and day, and the most common end stations of the busiest start
+    stations, all from the origin-destination matrices of the data.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter, the months are compared when "all"
+        (str) day - the day filter, the days are compared when "all"
+    Returns:
+        (RouteStats) the results
+    """
+    names = b_st.station_names(df)
+
+    def routes_by(group_field):
+        matrix = b_ro.od_matrix(df, group_field)
+        round_trips, trips = b_ro.round_trips(matrix)
+        results = {}
+        for group, label in enumerate(matrix.labels):
+            if trips[group]:
+                top = b_ro.top_routes(b_ro.od_slice(matrix, label), b_c.TOP_ROUTES)
+                results[label] = Routes({ names[start] + '->' + names[end]: count for start, end, count in top },
+                                        int(trips[group]), round(100 * round_trips[group] / trips[group], 1))
+        return results
+
+    by_month = by_day = None
+    if month == 'all':
+        by_month = { month_name(m): routes for m, routes in routes_by('Month').items() }
+    if day == 'all':
+        by_day = routes_by('Day of Week')
+
+    # The busiest start stations, ties going to the first name
+    #
+    matrix = b_ro.od_matrix(df)
+    busiest = b_agg.top_positions(b_ro.departures(matrix), b_c.ROUTE_STATIONS)
+    destinations = { names[station]: { names[end]: count for end, count
+                                       in b_ro.top_destinations(matrix, station, b_c.TOP_ROUTES) }
+                     for station in busiest if matrix.indptr[station + 1] > matrix.indptr[station] }
+
+    return RouteStats(len(df.index), routes_by(None).get('All', Routes({}, 0, 0.0)), destinations, by_month, by_day)
+
+def compute_heatmap_stats(df, month, day, by_user_type=None):
+    """
+    Counts the trips starting in each hour of each day of the week and of
+    each month, overall and optionally by user type, in one pass each.
+    Args:
+        (dataframe) df - the filtered data
+        (str) month - the month filter
+        (str) day - the day filter
+        (boolean) by_user_type - also count each user type, HEATMAP_BY_USER_TYPE if not given
+    Returns:
+        (HeatmapStats) the results
+    """
+    if by_user_type is None:
+        by_user_type = b_c.HEATMAP_BY_USER_TYPE
+
+    # Derive the trip start hour if it has not been yet
+    #
+    b_d.require(df, 'Hour')
+
+    def rows(counts, labels, name_of=str):
+        return { name_of(label): { str(hour): int(count) for hour, count in enumerate(row) }
+                 for label, row in zip(labels, counts) }
+
+    def heatmaps_by(split_field):
+        by_day, days, splits = b_k.hour_heatmap(df, 'Day of Week', split_field)
+        by_month, months, splits = b_k.hour_heatmap(df, 'Month', split_field)
+        return { split: Heatmap(rows(by_day[ix], days), rows(by_month[ix], months, month_name))
+                 for ix, split in enumerate(splits) if by_day[ix].any() }
+
+    by_user = heatmaps_by('User Type') if by_user_type else None
+
+    return HeatmapStats(len(df.index), heatmaps_by(None).get('All', Heatmap({}, {})), by_user)
+
+def heatmap_table(rows):
+    """
+    Turns the rows of a heatmap into a table for display or export.
+    Args:
+        (dict) rows - the count of each hour of each row, e.g. Heatmap.by_day
+    Returns:
+        Pandas DataFrame with a row for each day or month and a column for each hour
+    """
+    return pd.DataFrame.from_dict(rows, orient='index', dtype='int64')
+
+def from_dict(result_type, data):
+    """
+    Builds a result from its dict form, following the annotations of its fields.
+    Args:
+        result_type - the type to build
+        data - the dict form, as made by dataclasses.asdict
+    Returns:
+        the result
+    """
+    if is_dataclass(result_type):
+        hints = get_type_hints(result_type)
+        return result_type(**{ field.name: from_dict(hints[field.name], data[field.name])
+                               for field in fields(result_type) })
+
+    if get_origin(result_type) is Union:
+        if data is None:
+            return None
+        result_type = [ arg for arg in get_args(result_type) if arg is not type(None) ][0]
+        return from_dict(result_type, data)
+
+    if get_origin(result_type) is dict:
+        value_type = get_args(result_type)[1]
+        return { key: from_dict(value_type, value) for key, value in data.items() }
+
+    return data
+
+def to_json(result):
+    """
+    Saves a result as JSON.
+    Args:
+        result - one of the RESULT_TYPES
+    Returns:
+        (str) the JSON text
+    """
+    return json.dumps({ 'type': type(result).__name__, 'result': asdict(result) })
+
+def from_json(text):
+    """
+    Reads a result saved by to_json.
+    Args:
+        (str) text - the JSON text
+    Returns:
+        the result
+    """
+    data = json.loads(text)
+
+    return from_dict(RESULT_TYPES[data['type']], data['result'])
+
+
+def main():
+
+    print("Testing: to_json")
+    df = b_d.read_data('chicago')
+    for compute in [ compute_time_stats, compute_station_stats, compute_trip_duration_stats, compute_user_stats,
+                     compute_concurrency_stats, compute_flow_stats, compute_route_stats, compute_heatmap_stats ]:
+        result = compute(df, 'all', 'all')
+        print(type(result).__name__, len(to_json(result)), 'bytes', from_json(to_json(result)) == result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import sys
+import threading
+
+from collections import namedtuple
+
+# The following tests if the numpy library has been loaded
+#
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+import bikeshare_agg as b_agg
+import bikeshare_stations as b_st
+
+# A sparse origin-destination matrix of trip counts in CSR form, one block
+# of rows per group, e.g. per month. Row g * n_stations + s holds the trips
+# of group g starting at station s:
+#
+#   indptr     - where each row starts in indices and counts, and where the last one ends
+#   indices    - the end station id of each stored entry, sorted within a row
+#   counts     - the number of trips of each stored entry
+#   n_stations - how many stations there are
+#   labels     - the label of each group, in display order
+#
+ODMatrix = namedtuple('ODMatrix', ['indptr', 'indices', 'counts', 'n_stations', 'labels'])
+
+# The matrices built for the data in use, by grouping column, so that each
+# is built once however many routes are looked up in it. The data is known
+# by the stamp it was read with and its filters, so no frame is kept.
+#
+MATRICES = { 'key': None, 'matrices': {} }
+LOCK = threading.Lock()
+
+
+def build_od_matrix(df, group_field=None):
+    """
+    Builds the origin-destination matrix of every group from the trip codes,
+    in one sort.
+    Args:
+        (dataframe) df - the data set, with Trip Code
+        (str) group_field - the column to group by, or None for a single group
+    Returns:
+        (ODMatrix) the matrix
+    """
+    groups, labels = b_agg.group_codes(df, group_field)
+    n_stations = len(b_st.station_names(df))
+    base = b_st.trip_base(n_stations)
+
+    codes = df['Trip Code'].to_numpy()
+    valid = codes >= 0
+    codes = codes[valid].astype(np.int64)
+    starts, ends = np.divmod(codes, base)
+    rows = np.asarray(groups)[valid].astype(np.int64) * n_stations + starts
+
+    # Sorting the combined (row, end) keys puts the entries in CSR order
+    #
+    keys, counts = np.unique(rows * n_stations + ends, return_counts=True)
+    rows, indices = np.divmod(keys, n_stations)
+    indptr = np.searchsorted(rows, np.arange(len(labels) * n_stations + 1))
+
+    return ODMatrix(indptr, indices, counts.astype(np.int64), n_stations, labels)
+
+def od_matrix(df, group_field=None):
+    """
+    Returns the origin-destination matrix of a data frame, building it only
+    the first time it is asked for. Frames without a stamp or filters, e.g.
+    streamed from the csv file, have their matrix built every time.
+    Args:
+        (dataframe) df - the data set, with Trip Code
+        (str) group_field - the column to group by, or None for a single group
+    Returns:
+        (ODMatrix) the matrix
+    """
+    key = [ df.attrs.get('stamp'), df.attrs.get('filters') ]
+    if None in key:
+        return build_od_matrix(df, group_field)
+
+    with LOCK:
+        if MATRICES['key'] != key:
+            MATRICES.update(key=key, matrices={})
+        matrix = MATRICES['matrices'].get(group_field)
+
+    if matrix is None:
+        matrix = build_od_matrix(df, group_field)
+        with LOCK:
+            if MATRICES['key'] == key:
+                MATRICES['matrices'][group_field] = matrix
+
+    return matrix
+
+def od_slice(matrix, label):
+    """
+    Returns the matrix of one group, e.g. of one month, without copying the entries.
+    Args:
+        (ODMatrix) matrix - the matrix of every group
+        (str) label - the label of the group
+    Returns:
+        (ODMatrix) the matrix of the group, with a single group
+    """
+    group = matrix.labels.index(label)
+    rows = slice(group * matrix.n_stations, (group + 1) * matrix.n_stations + 1)
+    indptr = matrix.indptr[rows]
+    entries = slice(indptr[0], indptr[-1])
+
+    return ODMatrix(indptr - indptr[0], matrix.indices[entries], matrix.counts[entries],
+                    matrix.n_stations, [ label ])
+
+def entry_rows(matrix):
+    """
+    Returns the row of each stored entry.
+    """
+    return np.repeat(np.arange(len(matrix.indptr) - 1), np.diff(matrix.indptr))
+
+def top_routes(matrix, n):
+    """
+    Finds the most common routes of a single group matrix.
+    Args:
+        (ODMatrix) matrix - the matrix, e.g. a slice
+        (int) n - how many routes to find
+    Returns:
+        (list) the (start id, end id, count) of each route, most common first
+    """
+    top = b_agg.top_positions(matrix.counts, n)
+    rows = entry_rows(matrix)
+
+    return [ (int(rows[ix] % matrix.n_stations), int(matrix.indices[ix]), int(matrix.counts[ix])) for ix in top ]
+
+def top_destinations(matrix, station, n):
+    """
+    Finds the most common end stations of the trips from one station.
+    Args:
+        (ODMatrix) matrix - the matrix, e.g. a slice
+        (int) station - the id of the start station
+        (int) n - how many end stations to find
+    Returns:
+        (list) the (end id, count) of each end station, most common first
+    """
+    entries = slice(matrix.indptr[station], matrix.indptr[station + 1])
+    indices, counts = matrix.indices[entries], matrix.counts[entries]
+
+    return [ (int(indices[ix]), int(counts[ix])) for ix in b_agg.top_positions(counts, n) ]
+
+def departures(matrix):
+    """
+    Counts the trips from each station of a single group matrix.
+    """
+    return np.bincount(entry_rows(matrix), weights=matrix.counts,
+                       minlength=len(matrix.indptr) - 1).astype(np.int64)
+
+def round_trips(matrix):
+    """
+    Counts the trips of every group which end at the station they started from.
+    Args:
+        (ODMatrix) matrix - the matrix
+    Returns:
+        (array) the round trips of each group
+        (array) all the trips of each group
+    """
+    rows = entry_rows(matrix)
+    groups = rows // matrix.n_stations
+    is_round = matrix.indices == rows % matrix.n_stations
+    n_groups = len(matrix.labels)
+
+    return (np.bincount(groups[is_round], weights=matrix.counts[is_round], minlength=n_groups).astype(np.int64),
+            np.bincount(groups, weights=matrix.counts, minlength=n_groups).astype(np.int64))
+
+
+def main():
+
+    import bikeshare_data as b_d
+
+    print("Testing: top_routes")
+    df = b_d.filter_data(b_d.read_data('chicago'), 'all', 'all')
+    names = b_st.station_names(df)
+    matrix = od_matrix(df, 'Month')
+    for label in matrix.labels:
+        print(label, [ (names[start] + '->' + names[end], count) for start, end, count in top_routes(od_slice(matrix, label), 3) ])
+    print(df.groupby('Month')['Trip Code'].agg(lambda codes: codes.value_counts().head(3).to_dict()))
+    print(round_trips(matrix))
+    print(round_trips(od_matrix(df)), (df['Start Station'] == df['End Station']).sum())
+
+    print("Testing: od_matrix")
+    print(od_matrix(df, 'Month') is matrix, od_matrix(b_d.filter_data(df, 'june', 'all'), 'Month') is matrix)
+
+if __name__ == "__main__":
+    main()
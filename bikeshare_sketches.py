@@ -0,0 +1,403 @@
+import sys
+
+from collections import namedtuple
+
+# The following tests if the numpy library has been loaded
+#
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+# A Space-Saving summary of the most frequent codes of a field. It holds at
+# most k codes with their estimated counts, sorted from the largest count.
+#
+#   codes  - the codes being counted
+#   counts - the estimated count of each code, never below its true count
+#   errors - how much each count may be too high
+#   floor  - no code missing from the summary occurs more often than this
+#   total  - how many values the summary has seen
+#
+# For every code, count - error <= true count <= count, and for a summary
+# of N values error <= floor <= N / k. So any code occurring more than N / k
+# times is always held, and the top code is surely the mode when its
+# count - error is at least the count of the next one.
+#
+TopK = namedtuple('TopK', ['codes', 'counts', 'errors', 'floor', 'total'])
+
+
+def empty_topk():
+    """
+    Returns the summary of no values.
+    """
+    return TopK(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64), 0, 0)
+
+def prune_topk(codes, counts, errors, floor, total, k):
+    """
+    Keeps the k codes with the largest counts, ties going to the smallest code.
+    Args:
+        (array) codes - the codes, without repeats
+        (array) counts - the estimated count of each code
+        (array) errors - how much each count may be too high
+        (int) floor - the most any code not in codes may occur
+        (int) total - how many values were counted
+        (int) k - how many codes to keep
+    Returns:
+        (TopK) the summary
+    """
+    order = np.lexsort((codes, -counts))
+    kept, dropped = order[:k], order[k:]
+
+    # A dropped code occurs at most as often as its count says
+    #
+    if len(dropped):
+        floor = max(floor, int(counts[dropped[0]]))
+
+    return TopK(codes[kept], counts[kept], errors[kept], int(floor), int(total))
+
+def topk_of_counts(codes, counts, k):
+    """
+    Summarises exact counts, such as those of one chunk of rows.
+    Args:
+        (array) codes - the codes, without repeats
+        (array) counts - the exact count of each code
+        (int) k - how many codes to keep
+    Returns:
+        (TopK) the summary
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+
+    return prune_topk(codes, counts, np.zeros(len(codes), dtype=np.int64), 0, counts.sum(), k)
+
+def topk_of(codes, k):
+    """
+    Summarises a chunk of codes.
+    Args:
+        (array) codes - the codes, -1 where missing
+        (int) k - how many codes to keep
+    Returns:
+        (TopK) the summary
+    """
+    codes, counts = np.unique(codes[codes >= 0], return_counts=True)
+
+    return topk_of_counts(codes, counts, k)
+
+def held_counts(summary, codes):
+    """
+    Looks codes up in a summary.
+    Args:
+        (TopK) summary - the summary
+        (array) codes - the codes to look up
+    Returns:
+        (array) the count of each code, the floor of the summary if it is not held
+        (array) how much each count may be too high
+    """
+    counts = np.full(len(codes), summary.floor, dtype=np.int64)
+    errors = counts.copy()
+
+    if len(summary.codes):
+        order = np.argsort(summary.codes)
+        ix = order[np.searchsorted(summary.codes, codes, sorter=order).clip(max=len(order) - 1)]
+        held = summary.codes[ix] == codes
+        counts[held] = summary.counts[ix[held]]
+        errors[held] = summary.errors[ix[held]]
+
+    return counts, errors
+
+def merge_topk(first, second, k):
+    """
+    Merges two summaries into the summary of all of their values, such as
+    the summaries of two chunks or of two partitions of the cache.
+
+    A code missing from one summary is counted as occurring as often as
+    that summary's floor, with the same error, which keeps the bounds of
+    the merged summary.
+    Args:
+        (TopK) first - the first summary
+        (TopK) second - the second summary
+        (int) k - how many codes to keep
+    Returns:
+        (TopK) the merged summary
+    """
+    codes = np.union1d(first.codes, second.codes)
+    first_counts, first_errors = held_counts(first, codes)
+    second_counts, second_errors = held_counts(second, codes)
+
+    return prune_topk(codes, first_counts + second_counts, first_errors + second_errors,
+                      first.floor + second.floor, first.total + second.total, k)
+
+def topk_mode(summary, name_of=None):
+    """
+    Returns the most frequent code of a summary.
+    Args:
+        (TopK) summary - the summary
+        (function) name_of - decodes a code, so that ties go to the smallest name
+    Returns:
+        (int) the code
+        (int) its estimated count
+        (int) how much the count may be too high
+    """
+    top = np.flatnonzero(summary.counts == summary.counts[0])
+    if name_of is not None:
+        top = [ min(top, key=lambda ix: name_of(summary.codes[ix])) ]
+
+    ix = top[0]
+
+    return int(summary.codes[ix]), int(summary.counts[ix]), int(summary.errors[ix])
+
+
+# A sketch of the different codes of a field. With no precision it is
+# exact, and values holds every code seen, sorted. With a precision p it
+# is a HyperLogLog sketch, and values holds its 2 ** p registers; the
+# count is then within about 1.04 / sqrt(2 ** p) of the true count, e.g.
+# 1.6% for p = 12, in 4 KB whatever the number of codes.
+#
+Distinct = namedtuple('Distinct', ['precision', 'values'])
+
+
+def hash_codes(codes):
+    """
+    Mixes integer codes into well spread 64 bit hashes (the splitmix64 finaliser).
+    Args:
+        (array) codes - the codes
+    Returns:
+        (array) the uint64 hash of each code
+    """
+    hashes = codes.astype(np.uint64)
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= np.uint64(0xbf58476d1ce4e5b9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94d049bb133111eb)
+    hashes ^= hashes >> np.uint64(31)
+
+    return hashes
+
+def register_ranks(codes, precision):
+    """
+    Finds the HyperLogLog register of each code and the rank it gives the register.
+    Args:
+        (array) codes - the codes, none missing
+        (int) precision - the number of bits choosing the register
+    Returns:
+        (array) the register of each code
+        (array) the position of the first 1 bit after the register bits
+    """
+    hashes = hash_codes(codes)
+    width = 64 - precision
+    registers = (hashes >> np.uint64(width)).astype(np.int64)
+    rest = hashes & np.uint64((1 << width) - 1)
+
+    # frexp gives the bit length of the rest; 0 has none
+    #
+    _, bit_length = np.frexp(rest.astype(np.float64))
+
+    return registers, (width - bit_length + 1).astype(np.uint8)
+
+def distinct_of(codes, precision=None):
+    """
+    Sketches the different codes of a chunk.
+    Args:
+        (array) codes - the codes, -1 where missing
+        (int) precision - the HyperLogLog precision, or None to count exactly
+    Returns:
+        (Distinct) the sketch
+    """
+    codes = codes[codes >= 0]
+    if precision is None:
+        return Distinct(None, np.unique(codes).astype(np.int64))
+
+    values = np.zeros(1 << precision, dtype=np.uint8)
+    registers, ranks = register_ranks(codes, precision)
+    np.maximum.at(values, registers, ranks)
+
+    return Distinct(precision, values)
+
+def distinct_by(groups, n_groups, codes, precision=None):
+    """
+    Sketches the different codes of every group in one pass.
+    Args:
+        (array) groups - the group code of each row
+        (int) n_groups - how many groups there are
+        (array) codes - the value code of each row, -1 where missing
+        (int) precision - the HyperLogLog precision, or None to count exactly
+    Returns:
+        (list) the Distinct sketch of each group
+    """
+    valid = codes >= 0
+    groups = groups[valid].astype(np.int64)
+    codes = codes[valid].astype(np.int64)
+
+    if precision is None:
+        pairs = np.unique(np.stack([ groups, codes ]), axis=1)
+        splits = np.searchsorted(pairs[0], np.arange(1, n_groups))
+        return [ Distinct(None, values) for values in np.split(pairs[1], splits) ]
+
+    values = np.zeros((n_groups, 1 << precision), dtype=np.uint8)
+    registers, ranks = register_ranks(codes, precision)
+    np.maximum.at(values, (groups, registers), ranks)
+
+    return [ Distinct(precision, row) for row in values ]
+
+def merge_distinct(first, second):
+    """
+    Merges two sketches into the sketch of all of their codes, such as the
+    sketches of every month into the sketch of the whole year.
+    Args:
+        (Distinct) first - the first sketch
+        (Distinct) second - the second sketch, of the same precision
+    Returns:
+        (Distinct) the merged sketch
+    """
+    if first.precision is None:
+        return Distinct(None, np.union1d(first.values, second.values))
+
+    return Distinct(first.precision, np.maximum(first.values, second.values))
+
+def distinct_count(sketch):
+    """
+    Counts the different codes of a sketch.
+    Args:
+        (Distinct) sketch - the sketch
+    Returns:
+        (int) the exact count, or the HyperLogLog estimate
+    """
+    if sketch.precision is None:
+        return len(sketch.values)
+
+    m = len(sketch.values)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -sketch.values.astype(np.int64)))
+
+    # Small counts leave registers empty, and are better counted from them
+    #
+    zeros = int(np.count_nonzero(sketch.values == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+
+    return int(round(estimate))
+
+
+# A histogram of non-negative values such as trip durations, in buckets
+# growing by a fixed ratio. With a resolution of r buckets per doubling,
+# bucket i holds the values from 2 ** (i / r) up to 2 ** ((i + 1) / r), and
+# bucket 0 also holds the values below 1. Every histogram of a resolution
+# has the same buckets, so histograms merge by adding their counts, and a
+# percentile read off one is within about 2 ** (1 / (2 * r)) - 1 of the
+# true one, e.g. 1.1% for r = 32.
+#
+LogHistogram = namedtuple('LogHistogram', ['resolution', 'counts'])
+
+# How many doublings the buckets cover; larger values go in the last bucket
+#
+LOG_DOUBLINGS = 40
+
+
+def log_buckets(values, resolution):
+    """
+    Finds the bucket of each value.
+    Args:
+        (array) values - the values, none missing
+        (int) resolution - how many buckets there are per doubling
+    Returns:
+        (array) the bucket of each value
+    """
+    buckets = np.floor(np.log2(np.maximum(values, 1)) * resolution).astype(np.int64)
+
+    return buckets.clip(max=LOG_DOUBLINGS * resolution - 1)
+
+def log_histograms_by(groups, n_groups, values, resolution):
+    """
+    Builds the histogram of every group with a single 2-D bincount.
+    Args:
+        (array) groups - the group code of each row
+        (int) n_groups - how many groups there are
+        (array) values - the value of each row, NaN where missing
+        (int) resolution - how many buckets there are per doubling
+    Returns:
+        (list) the LogHistogram of each group
+    """
+    valid = ~np.isnan(values)
+    size = LOG_DOUBLINGS * resolution
+    keys = groups[valid].astype(np.int64) * size + log_buckets(values[valid], resolution)
+    counts = np.bincount(keys, minlength=n_groups * size).reshape(n_groups, size)
+
+    return [ LogHistogram(resolution, row) for row in counts ]
+
+def log_histogram_of(values, resolution):
+    """
+    Builds the histogram of a chunk of values.
+    Args:
+        (array) values - the values, NaN where missing
+        (int) resolution - how many buckets there are per doubling
+    Returns:
+        (LogHistogram) the histogram
+    """
+    return log_histograms_by(np.zeros(len(values), dtype=np.int8), 1, values, resolution)[0]
+
+def merge_log_histograms(first, second):
+    """
+    Merges two histograms into the histogram of all of their values.
+    Args:
+        (LogHistogram) first - the first histogram
+        (LogHistogram) second - the second histogram, of the same resolution
+    Returns:
+        (LogHistogram) the merged histogram
+    """
+    return LogHistogram(first.resolution, first.counts + second.counts)
+
+def log_percentiles(histogram, percentiles):
+    """
+    Estimates percentiles from a histogram, as the middle of the bucket
+    holding each one.
+    Args:
+        (LogHistogram) histogram - the histogram
+        (list) percentiles - the percentiles to find, from 0 to 100
+    Returns:
+        (array) the estimate of each percentile, NaN if the histogram is empty
+    """
+    cumulative = np.cumsum(histogram.counts)
+    total = cumulative[-1]
+    if not total:
+        return np.full(len(percentiles), np.nan)
+
+    # The rank of the value each percentile falls on, counting from 0
+    #
+    ranks = np.floor(np.asarray(percentiles, dtype=np.float64) / 100 * (total - 1))
+    buckets = np.searchsorted(cumulative, ranks, side='right')
+
+    return np.exp2((buckets + 0.5) / histogram.resolution)
+
+def main():
+
+    print("Testing: merge_topk")
+    rng = np.random.default_rng(0)
+    codes = rng.zipf(1.3, 200000) % 5000
+    summary = empty_topk()
+    for chunk in np.array_split(codes, 20):
+        summary = merge_topk(summary, topk_of(chunk, 64), 64)
+    exact = np.bincount(codes)
+    code, count, error = topk_mode(summary)
+    print('mode', code, 'count', count, 'error', error, 'exact', exact.argmax(), exact.max(),
+          'bound', summary.total // 64)
+
+    print("Testing: distinct_count")
+    months = [ distinct_of(chunk, 12) for chunk in np.array_split(codes, 12) ]
+    year = months[0]
+    for month in months[1:]:
+        year = merge_distinct(year, month)
+    print('estimate', distinct_count(year), 'exact', len(np.unique(codes)))
+
+    print("Testing: log_percentiles")
+    durations = rng.lognormal(6.5, 1, 200000)
+    months = [ log_histogram_of(chunk, 32) for chunk in np.array_split(durations, 12) ]
+    year = months[0]
+    for month in months[1:]:
+        year = merge_log_histograms(year, month)
+    print('estimate', log_percentiles(year, [ 50, 90, 95, 99 ]).round(1),
+          'exact', np.percentile(durations, [ 50, 90, 95, 99 ]).round(1))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import sys
+
+# The following tests if the pandas and numpy libraries have been loaded
+#
+try:
+    import pandas as pd
+except ImportError as error:
+    print('\n', '\tpandas has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+try:
+    import numpy as np
+except ModuleNotFoundError as error:
+    print('\n', '\tnumpy has not been imported.', '\n\n', '\texiting ...')
+    sys.exit()
+
+import bikeshare_constants as b_c
+
+
+def encode_stations(df):
+    """
+    Gives every station of a city a dense integer id and every trip a single code.
+
+    The start and end stations share one sorted dictionary of names, so the
+    categorical codes of both columns are the station ids. A trip is coded
+    as start id * trip base + end id.
+    Args:
+        (dataframe) df - the data of the city
+    """
+    names = sorted( set(df['Start Station'].cat.categories) | set(df['End Station'].cat.categories) )
+
+    df['Start Station'] = df['Start Station'].cat.set_categories(names)
+    df['End Station'] = df['End Station'].cat.set_categories(names)
+
+    df['Trip Code'] = trip_codes(df['Start Station'].cat.codes.to_numpy(),
+                                 df['End Station'].cat.codes.to_numpy(),
+                                 len(names))
+
+def trip_base(n_stations):
+    """
+    Returns the multiplier of the start id in a trip code.
+
+    It is the smallest power of two holding every station, so stations
+    added by a later ingest rarely change the codes of the cached trips.
+    Args:
+        (int) n_stations - the number of stations of the city
+    """
+    return 1 << max(n_stations - 1, 0).bit_length()
+
+def trip_codes(start_codes, end_codes, n_stations):
+    """
+    Codes each trip as a single integer.
+    Args:
+        (array) start_codes - the id of each start station, -1 if missing
+        (array) end_codes - the id of each end station, -1 if missing
+        (int) n_stations - the number of stations of the city
+    Returns:
+        (array) the code of each trip, -1 if either station is missing
+    """
+    base = trip_base(n_stations)
+    dtype = np.int32 if base * base <= np.iinfo(np.int32).max else np.int64
+
+    codes = start_codes.astype(dtype) * dtype(base) + end_codes.astype(dtype)
+    codes[(start_codes < 0) | (end_codes < 0)] = -1
+
+    return codes
+
+def station_names(df):
+    """
+    Returns the dictionary of station names of a city, indexed by station id.
+    Args:
+        (dataframe) df - the data of the city
+    """
+    return df['Start Station'].cat.categories
+
+def trip_name(code, names):
+    """
+    Decodes a trip code into 'Start Station->End Station'.
+    Args:
+        (int) code - the code of the trip
+        (index) names - the station names of the city
+    Returns:
+        (str) the name of the trip
+    """
+    start, end = divmod(int(code), trip_base(len(names)))
+
+    return names[start] + '->' + names[end]
+
+def field_codes(df, field_name):
+    """
+    Returns the integer codes of a station field and the size of their domain.
+    Args:
+        (dataframe) df - the data of the city
+        (str) field_name - 'Start Station', 'End Station' or 'Trips'
+    Returns:
+        (array) the codes, -1 where missing
+        (int) how many different codes there can be
+    """
+    n_stations = len(station_names(df))
+
+    if field_name == 'Trips':
+        return df['Trip Code'].to_numpy(), trip_base(n_stations) ** 2
+
+    return df[field_name].cat.codes.to_numpy(), n_stations
+
+def field_name_of(df, field_name, code):
+    """
+    Decodes a code of a station field for display.
+    Args:
+        (dataframe) df - the data of the city
+        (str) field_name - 'Start Station', 'End Station' or 'Trips'
+        (int) code - the code to decode
+    Returns:
+        (str) the station or trip name
+    """
+    names = station_names(df)
+
+    if field_name == 'Trips':
+        return trip_name(code, names)
+
+    return names[code]
+
+def count_codes(codes, size):
+    """
+    Counts how often each code occurs.
+    Args:
+        (array) codes - the codes, -1 where missing
+        (int) size - how many different codes there can be
+    Returns:
+        (array) the count of each code
+    """
+    return np.bincount(codes[codes >= 0], minlength=size)
+
+
+def main():
+
+    import bikeshare_data as b_d
+
+    print("Testing: station_names")
+    df = b_d.read_data('chicago')
+    names = station_names(df)
+    print(f'{len(names):,} stations, first trip: {trip_name(df["Trip Code"].iloc[0], names)}')
+
+if __name__ == "__main__":
+    main()
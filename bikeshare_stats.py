@@ -19,708 +19,755 @@ except ModuleNotFoundError as error:
 import bikeshare_inputs as b_i
 import bikeshare_constants as b_c
 import bikeshare_data as b_d
-
-def time_stats(df, city, month, day):
-    """Displays statistics on the most frequent times of travel."""
-
-    # Set up variables in order to store the statistics
+import bikeshare_cache as b_ca
+import bikeshare_results as b_r
+
+def show_inputs(city, month, day, records, day_heading='Day of Week', year='all'):
+    """
+    Builds the table of the user inputs shown above each analysis.
+    Args:
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (int) records - how many trips pass the filters
+        (str) day_heading - the heading of the day filter
+        (str) year - the year filter
+    Returns:
+        inputs - Pandas DataFrame with a single row
+    """
+    # Set up variables in order to store the inputs
     #
     stats = [{}]
-    inputs = pd.DataFrame(stats, index = ['Inputs: '])
+    inputs = pd.DataFrame( stats, index = ['Inputs: '] )
 
     # Set up a variable to store the inputs which will later be printed
     #
     inputs['City'] = city.title()
+    inputs['Year'] = year.title()
     inputs['Month'] = month.title()
-    inputs['Day'] = day.title()
-    inputs['Number of Records'] = f'{len(df.index):,}'
+    inputs[day_heading] = day.title()
+    inputs['Number of Records'] = f'{records:,}'
+
+    return inputs
+
+def print_inputs(city, month, day, year, records, day_heading='Day of Week'):
+    """
+    Prints the table of the user inputs, noting when the trips of a month
+    come from several years, as the statistics by month do not split them by year.
+    Args:
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+        (int) records - how many trips pass the filters
+        (str) day_heading - the heading of the day filter
+    """
+    with pd.option_context(*b_c.PD_OPTIONS):
+        print(show_inputs(city, month, day, records, day_heading, year), '\n')
+
+    years = b_ca.cached_years(city) if year == 'all' else []
+    if len(years) > 1:
+        print(f'Note: each month holds its trips of every year from {years[0]} to {years[-1]}.\n')
+
+def print_title(title):
+    """
+    Prints a centered and underlined title.
+    """
+    print(' '*12, title.center(50,' '), '\n', ' '*11, ('-'*(len(title))).center(50, ' '))
+
+def hour_name(hour):
+    """
+    Converts a 24 hour value to 12 hour with the right AM/PM.
+    """
+    return datetime.strptime(str(hour), "%H").strftime("%I %p")
+
+def leader_rows(tops):
+    """
+    Returns the row labels of the leading values after the mode, e.g. '#2: ',
+    enough for the longest of some leaders.
+    Args:
+        (list) tops - the leaders of each column, value to count
+    """
+    return [ f'#{rank}: ' for rank in range(2, max(map(len, tops), default=0) + 1) ]
+
+def leader_text(top, name_of=str):
+    """
+    Formats the leading values after the mode with their counts.
+    Args:
+        (dict) top - the leaders, value to count, most first
+        (function) name_of - formats a value for display
+    Returns:
+        (dict) the text of each leader, by row label
+    """
+    return { f'#{rank}: ': name_of(value) + f' ({count:,})'
+             for rank, (value, count) in enumerate(list(top.items())[1:], start=2) }
+
+def pause():
+    """
+    Waits for the user before clearing the screen.
+    """
+    b_i.get_yes_or_no( "Pause. " )
+    b_c.clear_screen()
+
+def time_stats(df, city, month, day, year='all'):
+    """Displays statistics on the most frequent times of travel."""
 
+    show_time_stats(b_r.compute_time_stats(df, month, day), city, month, day, year)
+
+def show_time_stats(result, city, month, day, year='all'):
+    """
+    Displays statistics on the most frequent times of travel.
+    Args:
+        (TimeStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
     # Show the user inputs
     #
-    with pd.option_context(*b_c.PD_OPTIONS):
-        print(inputs, '\n')
+    print_inputs(city, month, day, year, result.records, 'Day')
 
     # Define a variable to store the results
     #
-    results = pd.DataFrame( stats, index = ['Mode: ', 'Count: '] )
+    results = pd.DataFrame( [{}], index = ['Mode: ', 'Count: '] + leader_rows([ result.overall.top ]) )
 
-    # Get the mode and convert to 12 hour AM/PM
-    #
-    mode_start_hour = str(df['Hour'].mode()[0])
-    mode_start_hour = datetime.strptime(mode_start_hour, "%H").strftime("%I %p")
-    results['Trip Start hour'] = datetime.strptime(str( df['Hour'].mode()[0] ), "%H").strftime("%I %p")
-    # Count the number of trips for that hour
+    # Show the mode converted to 12 hour AM/PM, and the number of trips for that hour
     #
-    results['Trip Start hour']['Count: '] = f'{list(df["Hour"].value_counts())[0]:,}'
+    results['Trip Start hour'] = hour_name(result.overall.value)
+    results['Trip Start hour']['Count: '] = f'{result.overall.count:,}'
+    for row, text in leader_text(result.overall.top, hour_name).items():
+        results['Trip Start hour'][row] = text
 
     with pd.option_context(*b_c.PD_OPTIONS):
         print(results, '\n')
 
-    if month == 'all':
-        # Print a title
-        #
-        title_month = 'Trip Start hour (by Month)'
-        print(' '*12, title_month.center(50,' '), '\n', ' '*11, ('-'*(len(title_month))).center(50, ' '))
+    if result.by_month is not None:
+        print_title('Trip Start hour (by Month)')
 
-        results_month = pd.DataFrame( columns = list(b_c.MONTH_NAMES.values()), index = ['Mode: ', 'Count: '] )
+        results_month = pd.DataFrame( columns = list(result.by_month),
+                                      index = ['Mode: ', 'Count: '] + leader_rows([ hours.top for hours in result.by_month.values() ]) )
 
-        # Get the mode for the trip start hour by month
+        # Report the mode for the trip start hour of each month, and its count
         #
-        for m, hours in df.groupby('Month')['Hour']:
-            # Convert the 24 hour value to 12 hour with the right AM/PM
-            #
-            mode_start_hour = str(list(hours.mode())[0])
-            mode_start_hour = datetime.strptime(mode_start_hour, "%H").strftime("%I %p")
-            results_month[b_c.MONTH_NAMES[str(m)]]['Mode: '] = mode_start_hour
-            # Report the count for that trip start hour
-            #
-            results_month[b_c.MONTH_NAMES[str(m)]]['Count: '] = f'{list(hours.value_counts())[0]:,}'
+        for m, hours in result.by_month.items():
+            results_month[m]['Mode: '] = hour_name(hours.value)
+            results_month[m]['Count: '] = f'{hours.count:,}'
+            for row, text in leader_text(hours.top, hour_name).items():
+                results_month[m][row] = text
 
         with pd.option_context(*b_c.PD_OPTIONS):
             print(results_month, '\n')
 
-    if day == 'all':
-        # Print a title
-        #
-        title_day = 'Trip Start hour (by Day)'
-        print(' '*12, title_day.center(50,' '), '\n', ' '*11, ('-'*(len(title_day))).center(50, ' '))
-        
-        results_day = pd.DataFrame( columns = list(b_c.DAY_NAMES.values()), index = ['Mode: ', 'Count: '] )
+    if result.by_day is not None:
+        print_title('Trip Start hour (by Day)')
 
-        # Get the mode for the trip start hour by day
+        results_day = pd.DataFrame( columns = list(b_c.DAY_NAMES.values()),
+                                    index = ['Mode: ', 'Count: '] + leader_rows([ hours.top for hours in result.by_day.values() ]) )
+
+        # Report the mode for the trip start hour of each day, and its count
         #
-        for d, hours in df.groupby('Day of Week')['Hour']:
-            # Convert the trip start hour into 12 hour AM/PM format
-            #
-            mode_start_hour = str(list(hours.mode())[0])
-            mode_start_hour = datetime.strptime(mode_start_hour, "%H").strftime("%I %p")
-            results_day[d]['Mode: '] = mode_start_hour
-            # Report the count for that trip start hour
-            #
-            results_day[d]['Count: '] =  f'{list(hours.value_counts())[0]:,}'
+        for d, hours in result.by_day.items():
+            results_day[d]['Mode: '] = hour_name(hours.value)
+            results_day[d]['Count: '] =  f'{hours.count:,}'
+            for row, text in leader_text(hours.top, hour_name).items():
+                results_day[d][row] = text
 
         with pd.option_context(*b_c.PD_OPTIONS):
             print(results_day, '\n')
 
-    b_i.get_yes_or_no( "Pause. " )
-    b_c.clear_screen()
+    pause()
 
 
-def station_stats(df, city, month, day ):
-    """Displays statistics on the most popular stations and trip."""
+def station_table(field_stats):
+    """
+    Formats the mode, count, range and leading values of the station fields as a table.
+    Args:
+        (dict) field_stats - the StationField of each station field
+    Returns:
+        results - Pandas DataFrame with a row for each statistic
+    """
+    results = pd.DataFrame( [{}], index = ['Mode: ', 'Count: ', 'Range: ']
+                                          + leader_rows([ field.top for field in field_stats.values() ]) )
 
-    # Set up variables in order to store the inputs
-    #
-    stats = [{}]
+    for field_name, field in field_stats.items():
+        results[field_name] = field.mode
+        results[field_name]['Count: '] = f'{field.count:,}'
+        results[field_name]['Range: '] = f'{field.range:,}'
+        for row, text in leader_text(field.top).items():
+            results[field_name][row] = text
 
-    inputs = pd.DataFrame( stats, index = ['Inputs: '] )
-    
-    # Set up a variable to store the inputs which will later be printed
-    #
-    inputs['City'] = city.title()
-    inputs['Month'] = month.title()
-    inputs['Day of Week'] = day.title()
-    inputs['Number of Records'] = f'{len(df.index):,}'
+    return results
 
-    with pd.option_context(*b_c.PD_OPTIONS):
-        print(inputs, '\n')
+def station_legend():
+    """Prints the legend of the station statistics."""
 
-    title_month = 'Station Stats'
-    print(' '*12, title_month.center(50,' '), '\n', ' '*11, ('-'*(len(title_month))).center(50, ' '))
+    print('\nLegend: Trips show Start Station and End Station separated by \'->\'.',
+          '\n        Count shows how many trips there were for that mode.',
+          '\n        Range shows how many total unique trips there were.\n')
+
+    if b_c.TOP_N > 1:
+        print('        #2, #3, ... show the next most common, with their counts.\n')
 
-    results = pd.DataFrame( stats, index = ['Mode: ', 'Count: ', 'Range: '] )
+    if b_c.APPROXIMATE_STATIONS:
+        print('        Modes are approximate: a count can be too high by at most',
+              f'\n        the number of records / {b_c.TOPK_SIZE:,}.\n')
+
+    if b_c.DISTINCT_PRECISION is not None or b_c.APPROXIMATE_STATIONS:
+        error = 104 / np.sqrt(2 ** (b_c.DISTINCT_PRECISION or b_c.APPROXIMATE_PRECISION))
+        print(f'        Ranges are estimates, typically within {error:.1f}%.\n')
+
+def station_stats(df, city, month, day, year='all'):
+    """Displays statistics on the most popular stations and trip."""
 
-    # Collect the mode of the start station,
+    show_station_stats(b_r.compute_station_stats(df, month, day), city, month, day, year)
+
+def show_station_stats(result, city, month, day, year='all'):
+    """
+    Displays statistics on the most popular stations and trip.
+    Args:
+        (StationStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    print_inputs(city, month, day, year, result.records)
+
+    print_title('Station Stats')
+
+    # Show the mode of the start station, end station and trip,
     # plus why it is the mode (count).
-    # Finally, report how many unique start stations there were (range)
+    # Finally, report how many unique values there were (range)
     #
-    results['Start Station'] = df['Start Station'].mode()[0]
-    results['Start Station']['Count: '] = f'{list(df["Start Station"].value_counts())[0]:,}'
-    results['Start Station']['Range: '] = f'{len(df["Start Station"].value_counts()):,}'
+    with pd.option_context(*b_c.PD_OPTIONS):
+        print(station_table(result.overall), '\n')
 
-    # Collect the mode of the end station,
-    # plus why it is the mode (count).
-    # Finally, report how many unique end stations there were (range)
+    station_legend()
+    pause()
+
+    # Loop through the mode, count, range of the three fields of every month, then every day
     #
-    results['End Station'] = df['End Station'].mode()[0]
-    results['End Station']['Count: '] = f'{list(df["End Station"].value_counts())[0]:,}'
-    results['End Station']['Range: '] = f'{len(df["End Station"].value_counts()):,}'
+    for title, by_group in [ ('Station Stats (by Month)', result.by_month),
+                             ('Station Stats (by Day)', result.by_day) ]:
+        if by_group is None:
+            continue
 
-    # Collect the mode of the trip,
-    # plus why it is the mode (count).
-    # Finally, report how many unique trips there were (range)
+        print_title(title)
+
+        for label, field_stats in by_group.items():
+            print_title(label)
+            with pd.option_context(*b_c.PD_OPTIONS):
+                print(station_table(field_stats), '\n')
+
+        station_legend()
+        pause()
+
+
+def duration_text(duration):
+    """
+    Formats a Duration as the total in minutes and seconds, and the mean in minutes.
+    Args:
+        (Duration) duration - the total and mean in seconds
+    Returns:
+        (str) the total
+        (str) the mean
+    """
+    # Convert the sum to minutes and secs, and format the minutes into thousands
+    #
+    minutes = f'{int(duration.total // 60):,}' + ' minutes '
+    seconds = str(int(duration.total % 60)) + ' Seconds'
+    #
+    # Format the mean with two decimal places
+    #
+    mean_trip_duration = "{0:.2f}".format(duration.mean / 60) + ' Minutes'
+
+    return minutes + seconds, mean_trip_duration
+
+def percentile_rows():
+    """
+    Returns the row labels of the duration percentiles, e.g. '95%: '.
+    """
+    return [ f'{p:g}%: ' for p in b_c.DURATION_PERCENTILES ]
+
+def percentile_text(duration):
+    """
+    Formats the percentiles of a Duration in minutes.
+    Args:
+        (Duration) duration - the percentiles in seconds
+    Returns:
+        (dict) the text of each percentile, by row label
+    """
+    return { percentile + ': ': "{0:.2f}".format(value / 60) + ' Minutes'
+             for percentile, value in duration.percentiles.items() }
+
+def trip_duration_stats(df, city, month, day, year='all'):
+    """Displays statistics on the total, average and percentiles of the trip duration."""
+
+    show_trip_duration_stats(b_r.compute_trip_duration_stats(df, month, day), city, month, day, year)
+
+def show_trip_duration_stats(result, city, month, day, year='all'):
+    """
+    Displays statistics on the total, average and percentiles of the trip duration.
+    Args:
+        (DurationStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    print_inputs(city, month, day, year, result.records)
+
+    results = pd.DataFrame( [{}], index = ['Sum: ', 'Mean: '] + percentile_rows() )
+
+    # Show in minutes the total, the mean and the percentiles of the travel time
     #
-    results['Trips'] = df['Trips'].mode()[0]
-    results['Trips']['Count: '] = f'{list(df["Trips"].value_counts())[0]:,}'
-    results['Trips']['Range: '] = f'{len(df["Trips"].value_counts()):,}'
+    total, mean = duration_text(result.overall)
+    results['Trip Duration'] = total
+    results['Trip Duration']['Mean: '] = mean
+    for row, text in percentile_text(result.overall).items():
+        results['Trip Duration'][row] = text
 
     with pd.option_context(*b_c.PD_OPTIONS):
-        print(results, '\n')
+        print('\n', results, '\n')
 
-    print('\nLegend: Trips show Start Station and End Station separated by \'->\'.',
-          '\n        Count shows how many trips there were for that mode.',
-          '\n        Range shows how many total unique trips there were.\n')
+    if result.by_month is not None:
+        # Show in minutes the total travel time, the average and the percentiles but by month
+        #
+        results_month = pd.DataFrame( columns = list(result.by_month), index = ['Sum: ', 'Mean: '] + percentile_rows() )
 
-    b_i.get_yes_or_no( "Pause. " )
-    b_c.clear_screen()
+        print_title('Trip Duration (by Month)')
 
-    if month == 'all':
-        # Print a title
-        #
-        title_month = 'Station Stats (by Month)'
-        print(' '*12, title_month.center(50,' '), '\n',
-              ' '*11, ('-'*(len(title_month))).center(50, ' '))
+        for m, duration in result.by_month.items():
+            results_month[m]['Sum: '], results_month[m]['Mean: '] = duration_text(duration)
+            for row, text in percentile_text(duration).items():
+                results_month[m][row] = text
 
-        results_month = pd.DataFrame( columns = list(b_c.MONTH_NAMES.values()),
-                                      index = ['Station Stats'] )
+        with pd.option_context(*b_c.PD_OPTIONS):
+            print(results_month, '\n')
 
-        # Loop through the months
+    if result.by_day is not None:
+        # Show in minutes the total travel time, the average and the percentiles but by day
         #
-        for m in list(b_c.MONTH_NAMES.keys()):
-            #
-            results = pd.DataFrame( stats, index = ['Mode: ', 'Count: ', 'Range: '] )
-            #
-            for field_name in b_c.STATION_FIELDS:
-                #
-                # get mode, count, range of the three fields
-                #
-                mode_f_n = df[df['Month'] == int(m)][field_name].mode()[0]
-                count_f_n = f'{list(df[df["Month"] == int(m)][field_name].value_counts())[0]:,}'
-                range_f_n = f'{len(df[df["Month"] == int(m)][field_name].value_counts()):,}'
-                #
-                # store the mode, count, range of each field
-                #
-                results[field_name] = mode_f_n
-                results[field_name]['Count: '] = count_f_n
-                results[field_name]['Range: '] = range_f_n
-
-            
-            print(' '*12, b_c.MONTH_NAMES[str(m)].center(50,' '), '\n',
-                  ' '*11, ('-'*(len(b_c.MONTH_NAMES[str(m)]))).center(50, ' '))
-            with pd.option_context(*b_c.PD_OPTIONS):
-                print(results, '\n')
+        results_day = pd.DataFrame( columns = list(b_c.DAY_NAMES.values()), index = ['Sum: ', 'Mean: '] + percentile_rows() )
 
-        print('\nLegend: Trips show Start Station and End Station separated by \'->\'.',
-              '\n        Count shows how many trips there were for that mode.',
-              '\n        Range shows how many total unique trips there were.\n')
+        print_title('Trip Duration (by Day)')
 
-        b_i.get_yes_or_no( "Pause. " )
-        b_c.clear_screen()
+        for d, duration in result.by_day.items():
+            results_day[d]['Sum: '], results_day[d]['Mean: '] = duration_text(duration)
+            for row, text in percentile_text(duration).items():
+                results_day[d][row] = text
 
-    if day == 'all':
-        # Print a title
-        #
-        title_month = 'Station Stats (by Day)'
-        print(' '*12, title_month.center(50,' '), '\n',
-              ' '*11, ('-'*(len(title_month))).center(50, ' '))
+        with pd.option_context(*b_c.PD_OPTIONS):
+            print(results_day, '\n')
+
+    pause()
+
+
+def share_text(shares, name_of):
+    """
+    Combines the value names and their counts, and the names and their
+    percentages, into single strings.
+    Args:
+        (Shares) shares - the counts and percentages of each value
+        (function) name_of - shortens a value name for display
+    Returns:
+        (str) the counts
+        (str) the percentages
+    """
+    counts = ''
+    for value, count in shares.counts.items():
+        counts += name_of(value).ljust(7) + f'{count:,}'.rjust(7) + ' '
+
+    percentages = ''
+    for value, percent in shares.percentages.items():
+        percentages += name_of(value).ljust(7) + (str(percent) + '%').rjust(7) + ' '
+
+    return counts, percentages
+
+def show_shares(share_stats, heading, columns, name_of):
+    """
+    Prints the counts and percentages of a rider field, overall and by month and day.
+    Args:
+        (ShareStats) share_stats - the statistics
+        (str) heading - the heading of the field, e.g. 'Trips by User Type'
+        (dict) columns - the columns of the month and day tables
+        (function) name_of - shortens a value name for display
+    """
+    results = pd.DataFrame( [{}], index = ['Count: ', 'Percentage: '] )
+
+    # Combine the values and their counts into a single string, and the same for the percentages
+    #
+    counts, percentages = share_text(share_stats.overall, name_of)
+    if share_stats.overall.counts:
+        results[heading] = counts
+        results[heading]['Percentage: '] = percentages
 
-        results_month = pd.DataFrame( columns = list(b_c.MONTH_NAMES.values()),
-                                      index = ['Station Stats'] )
+    with pd.option_context(*b_c.PD_OPTIONS):
+        print('\n', results, '\n')
+
+    for by, by_group in [ ('Month', share_stats.by_month), ('Day', share_stats.by_day) ]:
+        if by_group is None:
+            continue
 
-        # Loop through the months
+        # Show the counts and percentages of each month or day
         #
-        for d in list(b_c.DAY_NAMES.values()):
-            #
-            results = pd.DataFrame( stats, index = ['Mode: ', 'Count: ', 'Range: '] )
-            #
-            for field_name in b_c.STATION_FIELDS:
-                #
-                # get mode, count, range of the three fields
-                #
-                mode_f_n = df[df['Day of Week'] == d][field_name].mode()[0]
-                count_f_n = f'{list(df[df["Day of Week"] == d][field_name].value_counts())[0]:,}'
-                range_f_n = f'{len(df[df["Day of Week"] == d][field_name].value_counts()):,}'
-                #
-                # store the mode, count, range of each field
-                #
-                results[field_name] = mode_f_n
-                results[field_name]['Count: '] = count_f_n
-                results[field_name]['Range: '] = range_f_n
-            
-            print(' '*12, d.center(50,' '), '\n', ' '*11, ('-'*(len(d))).center(50, ' '))
-            with pd.option_context(*b_c.PD_OPTIONS):
-                print(results, '\n')
+        results_by = pd.DataFrame( columns = columns[by], index = ['Count: ', 'Percentage: '] )
 
-        print('\nLegend: Trips show Start Station and End Station separated by \'->\'.',
-              '\n        Count shows how many trips there were for that mode.',
-              '\n        Range shows how many total unique trips there were.\n')
+        print_title(f'{heading} (by {by})')
 
-        b_i.get_yes_or_no( "Pause. " )
-        b_c.clear_screen()
+        for label, shares in by_group.items():
+            counts, percentages = share_text(shares, name_of)
+            results_by[label] = counts + '|'
+            results_by[label]['Percentage: '] = percentages + '|'
 
+        with pd.option_context(*b_c.PD_OPTIONS):
+            print(results_by, '\n')
+
+def user_stats(df, city, month, day, year='all'):
+    """Displays statistics on bikeshare users."""
 
-def trip_duration_stats(df, city, month, day):
-    """Displays statistics on the total and average trip duration."""
+    show_user_stats(b_r.compute_user_stats(df, month, day), city, month, day, year)
 
-    # Set up variables in order to store the inputs
+def show_user_stats(result, city, month, day, year='all'):
+    """
+    Displays statistics on bikeshare users.
+    Args:
+        (UserStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    inputs = show_inputs(city, month, day, result.records, year=year)
+
+    print_inputs(city, month, day, year, result.records)
+
+    # The month and day tables have a column for every month and day of the data
     #
-    stats = [{}]
-    inputs = pd.DataFrame( stats, index = ['Inputs: '] )
+    user_types = result.user_types
+    columns = { 'Month': list(user_types.by_month or {}), 'Day': list(b_c.DAY_NAMES.values()) }
 
-    # Set up a variable to store the inputs which will later be printed
+    # Count the number of trips by user type, and as a percentage
     #
-    inputs['City'] = city.title()
-    inputs['Month'] = month.title()
-    inputs['Day of Week'] = day.title()
-    inputs['Number of Records'] = f'{len(df.index):,}'
+    show_shares(user_types, 'Trips by User Type', columns, lambda user_type: '[' + user_type[0] + ']:')
 
-    with pd.option_context(*b_c.PD_OPTIONS):
-        print(inputs, '\n')
+    print('\nLegend: [S] -> Subscriber.', '\n        [C] -> Customer.\n        [D] -> Dependent.\n')
 
-    results = pd.DataFrame( stats, index = ['Sum: ', 'Mean: '] )
+    pause()
 
-    # Calculate in minutes the total travel time
-    # 
-    minutes = f'{int(df["Trip Duration"].sum() // 60):,}' + ' minutes '
-    seconds = str(int(df["Trip Duration"].sum() % 60)) + ' Seconds'
-    #
-    results['Trip Duration'] = minutes + seconds
+    with pd.option_context(*b_c.PD_OPTIONS):
+        print('\n', inputs, '\n')
 
-    # Calculate the mean travel time
+    # Count the number of trips by gender of the rider and also include that count as a percentage
     #
-    mean_trip_duration = "{0:.2f}".format(df["Trip Duration"].mean() / 60)
-    results['Trip Duration']['Mean: '] = mean_trip_duration + ' Minutes'
+    if result.genders is not None:
+        show_shares(result.genders, 'Trips by Gender', columns, lambda gender: gender + ':')
+    else:
+        print('No data collected for the gender of the bike rider.\n')
+
+    pause()
 
     with pd.option_context(*b_c.PD_OPTIONS):
-        print('\n', results, '\n')
+        print('\n', inputs, '\n')
+
+    # Display earliest, most recent, and most common year of birth
+    #
+    birth_years = result.birth_years
+    if birth_years is not None:
+        results = pd.DataFrame( [{}], index = ['Max: ', 'Min: ', 'Mode: '] + leader_rows([ birth_years.overall.top ]) )
 
-    if month == 'all':
-        # Calculate in minutes the total travel time and the average but by month
+        # The max value for the birth year is the youngest bike rider,
+        # the min the oldest, and the mode the most common birth year
         #
-        results_month = pd.DataFrame( columns = list(b_c.MONTH_NAMES.values()),
-                                      index = ['Sum: ', 'Mean: '] )
+        results['Rider Birth Year'] = str(birth_years.overall.max)
+        results['Rider Birth Year']['Min: '] = str(birth_years.overall.min)
+        results['Rider Birth Year']['Mode: '] = birth_years.overall.mode
+        for row, text in leader_text(birth_years.overall.top).items():
+            results['Rider Birth Year'][row] = text
 
-        title_month = 'Trip Duration (by Month)'
-        print(' '*12, title_month.center(50,' '), '\n', ' '*11, ('-'*(len(title_month))).center(50, ' '))
+        with pd.option_context(*b_c.PD_OPTIONS):
+            print('\n', results, '\n')
 
-        for m, durations in df.groupby('Month')['Trip Duration']:
-            # Calculate the sum and then convert to minutes and secs,
-            # and format the minutes into thousands
-            #
-            minutes = f'{int(durations.sum() // 60):,}' + ' minutes '
-            seconds = str(int(durations.sum() % 60)) + ' Seconds'
-            results_month[b_c.MONTH_NAMES[str(m)]]['Sum: '] = minutes + seconds
-            #
-            # Calculate the mean but format it with two decimal places
+        for by, by_group in [ ('Month', birth_years.by_month), ('Day', birth_years.by_day) ]:
+            if by_group is None:
+                continue
+
+            # Show the max, min, mode of the birth year of each month or day
             #
-            mean_trip_duration = "{0:.2f}".format(durations.mean() / 60) + ' Minutes'
-            results_month[b_c.MONTH_NAMES[str(m)]]['Mean: '] = mean_trip_duration
+            results_by = pd.DataFrame( columns = list(by_group) if by == 'Month' else columns[by],
+                                       index = ['Max: ', 'Min: ', 'Mode: ']
+                                               + leader_rows([ stats.top for stats in by_group.values() ]) )
 
-        with pd.option_context(*b_c.PD_OPTIONS):
-            print(results_month, '\n')
+            print_title(f'Rider Birth Year (by {by})')
 
-    if day == 'all':
-        # Calculate in minutes the total travel time and the average but by day
-        #
-        results_day = pd.DataFrame( columns = list(b_c.DAY_NAMES.values()),
-                                    index = ['Sum: ', 'Mean: '] )
+            for label, stats in by_group.items():
+                results_by[label] = str(stats.max)
+                results_by[label]['Min: '] = str(stats.min)
+                results_by[label]['Mode: '] = str(stats.mode)
+                for row, text in leader_text(stats.top).items():
+                    results_by[label][row] = text
 
-        title_day = 'Trip Duration (by Day)'
-        print(' '*12, title_day.center(50,' '), '\n', ' '*11, ('-'*(len(title_day))).center(50, ' '))
+            with pd.option_context(*b_c.PD_OPTIONS):
+                if by == 'Month':
+                    print(results_by, '\n')
+                else:
+                    print(results_by)
 
-        for d, durations in df.groupby('Day of Week')['Trip Duration']:
-            # Calculate the sum and then convert to minutes and secs,
-            # and format the minutes into thousands
-            #
-            minutes = f'{int(durations.sum() // 60):,}' + ' minutes '
-            seconds = str(int(durations.sum() % 60)) + ' Seconds'
-            results_day[d]['Sum: '] = minutes + seconds
-            #
-            # Calculate the mean but format it with two decimal places
-            #
-            mean_trip_duration = "{0:.2f}".format(durations.mean() / 60) + ' Minutes'
-            results_day[d]['Mean: '] = mean_trip_duration
+        print('\nLegend: Max means youngest.', '\n        Min means oldest.\n')
 
-        with pd.option_context(*b_c.PD_OPTIONS):
-            print(results_day, '\n')
+    else:
+        print('No data collected on the birth year of the rider.\n')
 
-    b_i.get_yes_or_no( "Pause. " )
-    b_c.clear_screen()
+    pause()
 
 
-def user_stats(df, city, month, day):
-    """Displays statistics on bikeshare users."""
+def peak_time(peak):
+    """
+    Formats the time a peak was reached, e.g. '03 Jun 04:05 PM'.
+    """
+    return pd.Timestamp(peak.time).strftime('%d %b %I:%M %p')
 
-    # Set up variables in order to store the inputs
-    #
-    stats = [{}]
-    inputs = pd.DataFrame( stats, index = ['Inputs: '] )
-    
-    # Set up a variable to store the inputs which will later be printed
-    #
-    inputs['City'] = city.title()
-    inputs['Month'] = month.title()
-    inputs['Day of Week'] = day.title()
-    inputs['Number of Records'] = f'{len(df.index):,}'
+def concurrency_stats(df, city, month, day, year='all'):
+    """Displays statistics on the number of bikes in use at once."""
 
-    with pd.option_context(*b_c.PD_OPTIONS):
-        print(inputs, '\n')
+    show_concurrency_stats(b_r.compute_concurrency_stats(df, month, day), city, month, day, year)
 
-    results = pd.DataFrame( stats, index = ['Count: ', 'Percentage: '] )
+def show_concurrency_stats(result, city, month, day, year='all'):
+    """
+    Displays statistics on the number of bikes in use at once.
+    Args:
+        (ConcurrencyStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    print_inputs(city, month, day, year, result.records)
 
-    # Count the number of trips by user type
-    #
-    prt_str = ''
-    for user_type, count in df['User Type'].agg(lambda x: x.value_counts().to_dict()).items():
-        # Combine the user type and the count into a string
-        # in order to combine the user types as a single value
-        #
-        prt_str += ('[' + user_type[0] + ']:').ljust(7) + f'{count:,}'.rjust(7) + ' '
-        results['Trips by User Type'] = prt_str
-    
-    # Convert the count of number of trips into percentage by user type
-    #
-    # https://blog.softhints.com/pandas-count-percentage-value-column/
+    if result.overall is None:
+        print('No data collected on trips with both a start and an end time.\n')
+        pause()
+        return
+
+    # Show the most bikes in use at once, and when it was first reached
     #
-    prt_str = ''
-    user_type = df['User Type']
-    items_u_t = user_type.agg(lambda x: (x.value_counts(normalize=True)
-                                          .mul(100)
-                                          .round(1)
-                                          .astype(str) + '%')
-                                          .to_dict()).items()
-    for user_type, percent in items_u_t:
-        #
-        # Combine the user type and the percentage into a string in order to make a single value
-        #
-        prt_str += ('[' + user_type[0] + ']:').ljust(7) + percent.rjust(7) + ' '
-        results['Trips by User Type']['Percentage: '] = prt_str
+    results = pd.DataFrame( [{}], index = ['Peak: ', 'Time: '] )
+    results['Bikes in Use'] = f'{result.overall.value:,}'
+    results['Bikes in Use']['Time: '] = peak_time(result.overall)
 
     with pd.option_context(*b_c.PD_OPTIONS):
-        print('\n', results, '\n')
-    
-    if month == 'all':
-        # Calculate the count and percentage of user type by month
-        #
-        results_month = pd.DataFrame( columns = list(b_c.MONTH_NAMES.values()),
-                                      index = ['Count: ', 'Percentage: '] )
+        print(results, '\n')
 
-        title_month = 'Trips by User Type (by Month)'
-        print(' '*12, title_month.center(50,' '), '\n',
-              ' '*11, ('-'*(len(title_month))).center(50, ' '))
+    # Show the peak of each hour of the day, the morning and the afternoon in a row each
+    #
+    print_title('Peak Bikes in Use (by Hour)')
 
-        # Get the counts of user types by month
-        #
-        prt_str = ''
-        month_u_t = df.groupby('Month')['User Type']
-        dict_items = dict(month_u_t.agg(lambda x: x.value_counts().to_dict())).items()
-        for m, counts in dict_items:
-            #
-            # loop through each month's counts
-            #
-            for user_type, count in list(counts.items()):
-                # Combine the user type and the count into a string in order to make a single value
-                #
-                prt_str += ('[' + user_type[0] + ']:').ljust(7) + f'{count:,}'.rjust(7) + ' '
+    results_hour = pd.DataFrame( columns = [ hour_name(hour)[:2] for hour in range(12) ], index = ['AM: ', 'PM: '] )
+    for hour, peak in result.by_hour.items():
+        results_hour.iloc[int(hour) // 12, int(hour) % 12] = f'{peak:,}'
 
-            results_month[b_c.MONTH_NAMES[str(m)]] = prt_str + '|'
-            prt_str = ''
+    with pd.option_context(*b_c.PD_OPTIONS):
+        print(results_hour, '\n')
 
-        # Calculate the percentages of user types by month
-        #
-        month_u_t = df.groupby('Month')['User Type']
-        dict_items = dict(month_u_t.agg(lambda x: (x.value_counts(normalize=True)
-                                                    .mul(100)
-                                                    .round(1)
-                                                    .astype(str) + '%')
-                                                    .to_dict())).items()
-        for m, percentages in dict_items:
-            # loop through each month's percentages
-            #
-            for user_type, percent in list(percentages.items()):
-                # Combine the user type and the percentages into a string in order to make single value
-                #
-                prt_str += ('[' + user_type[0] + ']:').ljust(7) + percent.rjust(7) + ' '
+    for title, by_group, columns in [ ('Peak Bikes in Use (by Month)', result.by_month, list(result.by_month or {})),
+                                      ('Peak Bikes in Use (by Day)', result.by_day, list(b_c.DAY_NAMES.values())) ]:
+        if by_group is None:
+            continue
 
-            results_month[b_c.MONTH_NAMES[str(m)]]['Percentage: '] = prt_str + '|'
-            prt_str = ''
+        print_title(title)
 
-        with pd.option_context(*b_c.PD_OPTIONS):
-            print(results_month, '\n')
-    
-    if day == 'all':
-        # Calculate the count and percentage of user type by day
+        # Report the peak of each month or day, and when it was reached
         #
-        results_day = pd.DataFrame( columns = list(b_c.DAY_NAMES.values()),
-                                    index = ['Count: ', 'Percentage: '] )
+        results_by = pd.DataFrame( columns = columns, index = ['Peak: ', 'Time: '] )
+        for label, peak in by_group.items():
+            results_by[label]['Peak: '] = f'{peak.value:,}'
+            results_by[label]['Time: '] = peak_time(peak)
 
-        title_day = 'Trips by User Type (by Day)'
-        print(' '*12, title_day.center(50,' '), '\n',
-              ' '*11, ('-'*(len(title_day))).center(50, ' '))
+        with pd.option_context(*b_c.PD_OPTIONS):
+            print(results_by, '\n')
 
-        # Get the counts of user types by day
-        #
-        prt_str = ''
-        day_u_t = df.groupby('Day of Week')['User Type']
-        dict_items = dict(day_u_t.agg(lambda x: x.value_counts().to_dict())).items()
-        for d, counts in dict_items:                                                     
-            # loop through each day's counts
-            #
-            for user_type, count in list(counts.items()):
-                # Combine the user type and the count into a string in order to make a single value
-                #
-                prt_str += ('[' + user_type[0] + ']:').ljust(7) + f'{count:,}'.rjust(7) + ' '
-            
-            results_day[d] = prt_str + '|'
-            prt_str = ''
-
-        # Calculate the percentages of user types by day
-        #
-        day_u_t = df.groupby('Day of Week')['User Type']
-        dict_items = dict(day_u_t.agg(lambda x: (x.value_counts(normalize=True)
-                                                  .mul(100)
-                                                  .round(1)
-                                                  .astype(str) + '%')
-                                                  .to_dict())).items()
-        for d, percentages in dict_items:
-            # loop through each day's percentages
-            #
-            for user_type, percent in list(percentages.items()):
-                # Combine the user type and the percentages into a string in order to make a single value
-                #
-                prt_str += ('[' + user_type[0] + ']:').ljust(7) + percent.rjust(7) + ' '
+    pause()
 
-            results_day[d]['Percentage: '] = prt_str + '|'
-            prt_str = ''
 
-        with pd.option_context(*b_c.PD_OPTIONS):
-            print(results_day, '\n')
+def flow_stats(df, city, month, day, year='all'):
+    """Displays the stations losing and gaining the most bikes."""
 
-    print('\nLegend: [S] -> Subscriber.', '\n        [C] -> Customer.\n        [D] -> Dependent.\n')
+    show_flow_stats(b_r.compute_flow_stats(df, month, day), city, month, day, year)
 
-    b_i.get_yes_or_no( "Pause. " )
-    b_c.clear_screen()
+def show_flow_stats(result, city, month, day, year='all'):
+    """
+    Displays the stations losing and gaining the most bikes, when they do
+    so most, and their net outflow by hour of the day.
+    Args:
+        (FlowStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    for title, stations in [ ('Stations Losing the Most Bikes', result.outflow),
+                             ('Stations Gaining the Most Bikes', result.inflow) ]:
+        print_inputs(city, month, day, year, result.records)
 
-    with pd.option_context(*b_c.PD_OPTIONS):
-        print('\n', inputs, '\n')
+        print_title(title)
 
-    # Count the number of trips by gender of the rider and also include that count as a percentage
-    #
-    # Define an error if the data field Gender was not included in the dataset
-    #
-    try:        
-        stats = [{}]
-        results = pd.DataFrame( stats, index = ['Count: ', 'Percentage: '] )
+        if not stations:
+            print('No station has more departures than arrivals or the other way around.\n')
+            pause()
+            continue
 
-        # Count the number of trips by gender
+        # Show the departures, arrivals and net outflow of each station, and
+        # the hour of the week in which its flow is largest
         #
-        prt_str = ''
-        for gender, count in df['Gender'].agg(lambda x: x.value_counts().to_dict()).items():
-            # Combine the gender and count into a string in order to make a single value
-            #
-            prt_str += (gender + ':').ljust(7) + f'{count:,}'.rjust(7) + ' '
-            results['Trips by Gender'] = prt_str
-        
-        # Calculate the percentage of bike trips by gender
-        #
-        prt_str = ''
-        gender_items = df['Gender'].agg(lambda x: (x.value_counts(normalize=True)
-                                                    .mul(100)
-                                                    .round(1)
-                                                    .astype(str) + '%')
-                                                    .to_dict()).items()
-        for gender, percent in gender_items:
-            # Combine the gender and the percentage into a string in order to make a single value
-            #
-            prt_str += (gender + ':').ljust(7) + percent.rjust(7) + ' '
-            results['Trips by Gender']['Percentage: '] = prt_str
+        results = pd.DataFrame( index = [ name + ': ' for name in stations ],
+                                columns = ['Departures', 'Arrivals', 'Net', 'Peak', 'Peak Net'] )
+        for name, flow in stations.items():
+            results.loc[name + ': '] = [ f'{flow.departures:,}', f'{flow.arrivals:,}', f'{flow.net:+,}',
+                                         flow.peak_day[:3] + ' ' + hour_name(flow.peak_hour), f'{flow.peak_net:+,}' ]
 
         with pd.option_context(*b_c.PD_OPTIONS):
-            print('\n', results, '\n')
-        
-        if month == 'all':
-            # Count the number of bike trips by gender and by month
-            # and also calculate the percentage
-            #
-            results_month = pd.DataFrame( columns = list(b_c.MONTH_NAMES.values()),
-                                          index = ['Count: ', 'Percentage: '] )
+            print(results, '\n')
 
-            title_month = 'Trips by Gender (by Month)'
-            print(' '*12, title_month.center(50,' '), '\n',
-                  ' '*11, ('-'*(len(title_month))).center(50, ' '))
+        # Show the net outflow of each station by hour of the day, the morning and the afternoon apart
+        #
+        for half in ['AM', 'PM']:
+            print_title(f'Net Outflow by Hour ({half})')
 
-            # Loop through each month getting the counts
-            #
-            prt_str = ''
-            dict_items = dict(df.groupby('Month')['Gender'].agg(lambda x: x.value_counts()
-                                                                           .to_dict())).items()
-            for m, counts in dict_items:
-                #
-                # Loop through each gender getting its percent
-                #
-                for gender, count in list(counts.items()):
-                    #
-                    # Combine the gender and the counts into a string
-                    # in order to make a single value
-                    #
-                    prt_str += (gender + ':').ljust(7) + f'{count:,}'.rjust(7) + ' '
-               
-                results_month[b_c.MONTH_NAMES[str(m)]] = prt_str + '|'
-                prt_str = ''
-
-            # Loop through each month getting the percentages
-            #
-            month_g = df.groupby('Month')['Gender']
-            dict_items = dict(month_g.agg(lambda x: (x.value_counts(normalize=True)
-                                                      .mul(100)
-                                                      .round(1)
-                                                      .astype(str) + '%')
-                                                      .to_dict())).items()
-            for m, percentages in dict_items:
-                #
-                # Loop through each gender getting its percent
-                #
-                for gender, percent in list(percentages.items()):
-                    #
-                    # Combine the gender and the percentages into a string
-                    # in order to make a single value
-                    #
-                    prt_str += (gender + ':').ljust(7) + percent.rjust(7) + ' '
-                
-                results_month[b_c.MONTH_NAMES[str(m)]]['Percentage: '] = prt_str + '|'
-                prt_str = ''
+            offset = 0 if half == 'AM' else 12
+            results_hour = pd.DataFrame( index = [ name + ': ' for name in stations ],
+                                         columns = [ hour_name(hour)[:2] for hour in range(12) ] )
+            for name, flow in stations.items():
+                results_hour.loc[name + ': '] = [ f'{flow.by_hour[str(hour + offset)]:+,}' for hour in range(12) ]
 
             with pd.option_context(*b_c.PD_OPTIONS):
-                print(results_month, '\n')
-      
-        if day == 'all':
-            # Count the number of bike trips by gender and by day
-            # and also calculate the percentage
-            #
-            results_day = pd.DataFrame( columns = list(b_c.DAY_NAMES.values()),
-                                        index = ['Count: ', 'Percentage: '] )
+                print(results_hour, '\n')
 
-            title_day = 'Trips by Gender (by Day)'
-            print(' '*12, title_day.center(50,' '), '\n',
-                  ' '*11, ('-'*(len(title_day))).center(50, ' '))
+        print('Legend: Net means departures less arrivals.\n')
 
-            # Loop through each day getting the counts
-            #
-            prt_str = ''
-            day_g = df.groupby('Day of Week')['Gender']
-            dict_items = dict(day_g.agg(lambda x: x.value_counts()
-                                                   .to_dict())).items()
-            for d, counts in dict_items:
-                #
-                # Loop through each gender getting its count
-                #
-                for gender, count in list(counts.items()):
-                    #
-                    # Combine the gender and the counts into a string
-                    # in order to make a single value
-                    #
-                    prt_str += (gender + ':').ljust(7) + f'{count:,}'.rjust(7) + ' '
-                
-                results_day[d] = prt_str + '|'
-                prt_str = ''
-
-            # Loop through each day getting the percentages
-            #
-            day_g = df.groupby('Day of Week')['Gender']
-            dict_items = dict(day_g.agg(lambda x: (x.value_counts(normalize=True)
-                                                    .mul(100)
-                                                    .round(1)
-                                                    .astype(str) + '%')
-                                                    .to_dict())).items()
-            for d, percentages in dict_items:
-                #
-                # Loop through each gender getting its percent
-                #
-                for gender, percent in list(percentages.items()):
-                    #
-                    # Combine the gender and the percentages into a string
-                    # in order to make a single value
-                    #
-                    prt_str += (gender + ':').ljust(7) + percent.rjust(7) + ' '
-               
-                results_day[d]['Percentage: '] = prt_str + '|'
-                prt_str = ''
+        pause()
 
-            with pd.option_context(*b_c.PD_OPTIONS):
-                print(results_day, '\n')
 
-    except:
-        print('No data collected for the gender of the bike rider.\n')
+def route_table(routes):
+    """
+    Formats the most common routes, their trip counts and the share of round trips as a table.
+    Args:
+        (Routes) routes - the routes
+    Returns:
+        results - Pandas DataFrame with a row for each route
+    """
+    results = pd.DataFrame( columns = ['Route', 'Trips'] )
+    for rank, (route, count) in enumerate(routes.top.items(), start=1):
+        results.loc[f'{rank}: '] = [ route, f'{count:,}' ]
+    results.loc['Round Trips: '] = [ f'{routes.round_trips}% of {routes.trips:,} trips', '' ]
 
-    b_i.get_yes_or_no( "Pause. " )
-    b_c.clear_screen()
+    return results
 
-    with pd.option_context(*b_c.PD_OPTIONS):
-        print('\n', inputs, '\n')
+def route_stats(df, city, month, day, year='all'):
+    """Displays statistics on the most common routes."""
 
-    # Display earliest, most recent, and most common year of birth
-    #
-    stats = [{}]
-    results = pd.DataFrame( stats, index = ['Max: ', 'Min: ', 'Mode: '] )
+    show_route_stats(b_r.compute_route_stats(df, month, day), city, month, day, year)
 
-    try:
-        # Find the max value for the birth year (youngest bike rider)
-        #
-        results['Rider Birth Year'] = str(int(df['Year of Birth'].max()))
+def show_route_stats(result, city, month, day, year='all'):
+    """
+    Displays the most common routes and the share of round trips, overall
+    and by month and day, and the most common end stations of the busiest
+    start stations.
+    Args:
+        (RouteStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    print_inputs(city, month, day, year, result.records)
 
-        # Find the min value for the birth year (youngest bike rider)
-        #
-        results['Rider Birth Year']['Min: '] = str(int(df['Year of Birth'].min()))
+    print_title('Most Common Routes')
 
-        # Find the mode value for the birth year (most common birth year of the rider)
-        #
-        results['Rider Birth Year']['Mode: '] =df['Year of Birth'].mode()[0] 
+    with pd.option_context(*b_c.PD_OPTIONS):
+        print(route_table(result.overall), '\n')
+
+    # Show where the trips from the busiest start stations most often end
+    #
+    for station, ends in result.destinations.items():
+        print_title(f'Most Common End Stations from {station}')
+
+        results = pd.DataFrame( columns = ['End Station', 'Trips'] )
+        for rank, (end, count) in enumerate(ends.items(), start=1):
+            results.loc[f'{rank}: '] = [ end, f'{count:,}' ]
 
         with pd.option_context(*b_c.PD_OPTIONS):
-            print('\n', results, '\n')
+            print(results, '\n')
 
-        if month == 'all':
-            # Find the max, min, mode of the bike rider's birth year by month
-            #
-            results_month = pd.DataFrame( columns = list(b_c.MONTH_NAMES.values()),
-                                          index = ['Max: ', 'Min: ', 'Mode: '] )
+    pause()
 
-            title_month = 'Rider Birth Year (by Month)'
-            print(' '*12, title_month.center(50,' '), '\n',
-                  ' '*11, ('-'*(len(title_month))).center(50, ' '))
+    for title, by_group in [ ('Most Common Routes (by Month)', result.by_month),
+                             ('Most Common Routes (by Day)', result.by_day) ]:
+        if by_group is None:
+            continue
 
-            # Loop through each month
-            #
-            for m, birth_year in df.groupby('Month')['Year of Birth']:
-                #
-                # Find the max, min, mode of the birth year
-                #
-                month_name = b_c.MONTH_NAMES[str(m)]
-                results_month[month_name] = str(int(birth_year.max()))
-                results_month[month_name]['Min: '] = str(int(birth_year.min()))
-                results_month[month_name]['Mode: '] = str(int(birth_year.mode()[0]))
+        print_title(title)
 
+        for label, routes in by_group.items():
+            print_title(label)
             with pd.option_context(*b_c.PD_OPTIONS):
-                print(results_month, '\n')
+                print(route_table(routes), '\n')
 
-        if day == 'all':
-            # Find the max, min, mode of the bike rider's birth year by day
-            #
-            results_day = pd.DataFrame( columns = list(b_c.DAY_NAMES.values()),
-                                        index = ['Max: ', 'Min: ', 'Mode: '] )
+        pause()
 
-            title_day = 'Rider Birth Year (by Day)'
-            print(' '*12, title_day.center(50,' '), '\n',
-                  ' '*11, ('-'*(len(title_day))).center(50, ' '))
 
-            for day_name, birth_year in df.groupby('Day of Week')['Year of Birth']:
-                #
-                # Find the max, min, mode of the birth year
-                #
-                results_day[day_name] = str(int(birth_year.max()))
-                results_day[day_name]['Min: '] = str(int(birth_year.min()))
-                results_day[day_name]['Mode: '] = str(int(birth_year.mode()[0]))
+def heatmap_stats(df, city, month, day, year='all'):
+    """Displays the trips by hour of each day of the week and of each month."""
 
-            with pd.option_context(*b_c.PD_OPTIONS):
-                print(results_day)
+    show_heatmap_stats(b_r.compute_heatmap_stats(df, month, day), city, month, day, year)
 
-        print('\nLegend: Max means youngest.', '\n        Min means oldest.\n')
+def show_heatmap(rows, title):
+    """
+    Prints the trips by hour of each row of a heatmap, the morning and the afternoon apart.
+    Args:
+        (dict) rows - the count of each hour of each row, e.g. Heatmap.by_day
+        (str) title - the title of the heatmap
+    """
+    table = b_r.heatmap_table(rows)
 
-    except:
-        print('No data collected on the birth year of the rider.\n')
+    for half, hours in [ ('AM', range(12)), ('PM', range(12, 24)) ]:
+        print_title(f'{title} ({half})')
 
-    b_i.get_yes_or_no( "Pause. " )
-    b_c.clear_screen()
+        results = pd.DataFrame( index = [ label + ': ' for label in table.index ],
+                                columns = [ hour_name(hour)[:2] for hour in range(12) ] )
+        for label, counts in table.iterrows():
+            results.loc[label + ': '] = [ f'{counts[str(hour)]:,}' for hour in hours ]
+
+        with pd.option_context(*b_c.PD_OPTIONS):
+            print(results, '\n')
+
+def show_heatmap_stats(result, city, month, day, year='all'):
+    """
+    Displays the trips starting in each hour of each day of the week and of
+    each month, overall and by user type when it is asked for.
+    Args:
+        (HeatmapStats) result - the statistics
+        (str) city - name of the city
+        (str) month - the month filter
+        (str) day - the day filter
+        (str) year - the year filter
+    """
+    heatmaps = [ ('', result.overall) ]
+    heatmaps += [ (f' - {user_type}', heatmap) for user_type, heatmap in (result.by_user_type or {}).items() ]
+
+    for name, heatmap in heatmaps:
+        print_inputs(city, month, day, year, result.records)
+
+        if not heatmap.by_day:
+            print('No trips to count.\n')
+            pause()
+            continue
+
+        show_heatmap(heatmap.by_day, 'Trips by Day and Hour' + name)
+        pause()
+
+        show_heatmap(heatmap.by_month, 'Trips by Month and Hour' + name)
+        pause()
 
 
 def main():